@@ -1,21 +1,51 @@
 # %% import and definition
+import asyncio
 import base64
+import bisect
+import contextlib
+import contextvars
+import cProfile
+import functools
+import hmac
+import importlib.util
 import itertools as itt
-from io import StringIO
+import json
+import multiprocessing as mp
+import os
+import pstats
+import random
+import re
+import site
+import struct
+import sys
+import threading
+import time
+import warnings
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 
 import numpy as np
 import pandas as pd
 import panel as pn
-import plotly.express as px
+import plotly.graph_objects as go
+import requests
 import spotipy
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from plotly.express.colors import qualitative
-from sklearn.decomposition import PCA
-from sklearn.manifold import Isomap, SpectralEmbedding
+from plotly.colors import qualitative
+from requests.adapters import HTTPAdapter
 from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
+
+try:
+    import sqlite3
+except ImportError:  # not bundled with pyodide by default
+    sqlite3 = None
 
 FEATS = [
     "danceability",
@@ -37,9 +67,1342 @@ APP_ID = b"gAAAAABmVWcj69yZexqsTUWDOri8TQsvqyO36J5Qbm5G1rJEJQ3ePqRtIL9CzNQDQpRsf
 APP_SECRET = b"gAAAAABmVWcjpgtCHRP6qeZfnu_y-6-6BMz3L9pOWDBzpX2Zq1ng5pIXall8Z6GmTlW4BMGHOkP3CUSVvvVNAU0pEnS0arve8dWOLbcczgJbHMnjiKXQGjDqvA1SmV27UzbXTgtLK79V"
 DATA = b"gAAAAABmVWcjVS0wbucdFxW4YXkPQv6z6afksP3CQ5jCSPgXrrjF-GG42szszvnE-HV5DMhHIoHL_OpqRkvxq1yzk_WdWTMQeZ7X10SELeAOx7unoQkdw901e0TYkoj4f-yp9tazuW0JCiOo8QK_MKI4VgCviZ-gFLPf8V-AczckQg39qScaUZ0JoRV8RkJieCrKSuzLcqAzEgj-sZvrTC81yLsSLzipHKu_bx2u6ef-WPCZp0p7jDXhTbvy_Xm8UYvFOEArtNWHzBE3NXR21uk1Zrx2LvIpm2oUPdSqVr0JOWZaToJMnK6SfZEbeKvH7dD0XK2KoBcJvi-xhCunwWBoy4hYISn_ld75I8f4DmBnHANYdd-1by1C-AIqfhLL3aZGbGVRbNIOFuyXfr0dF5IixkO2Y9evIAdhtIZTSXLvrJScR9185ar98o19r5ii_qkux6laFBIRlU-6QykTSZ6dWY5_xMtsyoWrBYBkruhzZnEcA5RVSW3isox0DdNnITRfeOpkp9D5RxsPZEp5r2plZIKbJpjCufaNBga_31ovoid9dSAJuSXvGf6Q_JjikxSMYYu78qFWOPm_DYVhgr_sWMs2bkgc-cWHaLYHxv--h_QIGdIe0K4dlqX0gZ1KvJQZ6a7DUf7XAv5bhcDtrc1ZFlVRYYPl45C9HrfrRG7EyIB3RxT88O38Mn99a3WVGpl8qJKDDu1WTlLeul-BaAywncf51ehzL49tL8Qhbio4kQVjYNjEOJJbOemX4M5aJb17hk3X7FeiM1AU6S2-z7UoRuX72BXORJdZIfgrnN9wp4YfLu-c9gjSpkBbjti90ce1NmsZT7CUJQXNbqGOO5iKBMIUarCmgn0pj3rxWMWp4PzzQm0F_gbLVdNzvrkQ6ddUr8MHBuiaib1VTeIEuYbId-m1HPyEduM5MGqSRJMo5uWEBOrNwibm5uuGaaWSOibC2Rp-kMHqQJRUKGF2_5svzYuKrx7fCPWV1xDDyL2SMzvYIfikH-QJRqWUs6gUoVJdkHRCUEw6CqIRGwkxYye_XlVj-LtehW7uAXJfAYdv90tyAHwwytwtLiZRXQhyce1WHS7FfOmgvasyZs754xH0-pcDgOLU2VeCigS4WuBknIrpJXyeGqrJxKpMxAfmm4SmFy686WUavj7D1dfaZ4xr91ryBLoOk4VusMDlitGBpEkxfiIhA5_8MKbfnwfSR2WDs-Ygye-ktY6c0kTV92HOyG89h5xS4MjoAaKuyQLBKS-hBIFomDx_z_PuRA4oLhZ6Ax1Uin2MOLeIPD86Hbh69JCK1w-HW1QAHnXPfd8fEikXpOzekOG2OfM8Wa7l2OPnBfz4N1c9j7bkP_NceCOsdxu9t2aSfMaTYLxStjJJb6yD0K09yrnfFs0eWzITHfFopW7XHXOvkV4F-yBCrNY3TtUCN8-otaDhAmQPy9anwiibljJiMQzxEt3djn2vxsyUwKXa2wErZ1KFRKkI13onWHYi1325zSluTWZH2NAMhIPuHAUF5aliQjtEMqMvIxr2rFmwhB2U5wEZPjNUuwhZueiEsfSgWrS7eSPXMwXueRkkT3Tw25NxraBa3yT0I60rn7eD6eNU_ibPngPtQAMVyfiRRqeA7flN8QB_ZKfPWybR8KaPZ2GgdqCxfmIBvgsuAfsHer0xwoym81qH0fgYJ0L_SUr-IGhFrm0PYn956OD6POrpIAl4yk57S6qBCCEdv8_NB96iUvVN6YNoETKVKa588XZaxJplMW6-x38IoZV02sbJGwAqndY3THXVCEdxawGdRlsNttlT1YQbIzZroE77nUkhg77n6Ew5VpNQ5eKh_6AQLoVCiypXN4c_FKpRgfm9IMcjgGvzdqWNa-TKyc1rQfH2WIq61CMnBRhPGIFmTWr_NnWFQM0MIUkW_n6m-oz-GV7hTenE4LYdNvb4SKcxuUU-vA_bwhhOv3YOzwfzdivWsv5YCBY_Nu9ARbg9ZN9vAbq3P0QmCWdj83GLw_xEPPeURT0jY0A15-RyYoeDX65_hBGkSr0Y-EPVIzj03j7fQdy00LYrVRCkeYX2iyZd-NuHrtiMuKXE8s3wXKOcrTqZZLMwrw3bEzt_9ySLQI7HopRuA3WWeUB_xO-iYJHOfW9XqqnOQtlk-6vxAr-Jtl7lBszf69TDTSXlJpFpaoWgwjSkHMzUAUQgEkdA1VqHW1j8mj5sohb7PKBAACM082cSqJyP6v-ikuTfZZwZEXvKNE0CrkhAQL2HSMDXVi_RpEoceP1EElpgSdugP6jveoNWsFQKZpmQGjD06mB2iJ-7WHEvsdfc6lN468RUg1Xnm32_52SlWpwC95gDV9z0OvLwwHvlx4P9bkMmgXLSyrBAKlWNkjcdzBwKe-BISy2JeeXDuAFOX9SNPxZYcoMxH2dsToEgV6FotydbWaYbqSoCw_yJcHzdb9ZsNIBhsi8KA2gMele-WM-0LEdew8Z6tM6C01zxPpz5O5W8l4eeL40MliaaWTHy7Ez_4zy0e0euB8B4Yy4feytooQFAKzO0_TvO0yLK0mqZ4HZKGfBIWm2OkrnpKuXyLnXqKrz5eFpmQyQoBG3cdCPjuRHCxIZGQOBA13MXUqfj-hTbqYa_Hhvzy8vh1rfMEIN9bF8mMNrHH01Xc2Xo456kBjzqoojCzGx9mZ2hsygzRG2Vs8WX009O3anLkTOU9z1IoqNwMk0nWbjvEq2xWl2r-CuYqMfvXRXvQ15O1xZTGCT5ZtSBRDDqKZXO-SMN6ABG3HX8imaiA_S2mqyUEjXTAq1eYn9ZCk5eVhGoTrGdcSRZSwNk12an54k7F74cnREj6zH1rzul8So4w67mK2AgduURJ746oD0mkv3VTmYCH9wVbTwcGirMO_ZKLZnoEMYcz183BpjgwIwZQnb7m9hcjBO3Ct7mB7wHTyuOFh0cd85epWQxksCud-7ensSGFPmBA3kV5hKu3LisMrM3v1U-J-bf8jJ8KWk_5d5LvX4AinluIakCx6JdZWFWdEJawkhMeq9s_WRqP_TmqdKvpSdDiivAP9M8IvrDEGQYrZXmhxvaZKRocl9_ZR1MtKuSAN9f7nd-au2I3Gf5Z0mx18h0NvUfLiazoWyw2UU7hHU6t_F1NF95XSxN92zh1CCU9Flzi0Xj77HJYZexVctMPCb3LNRQY78ap3WTqOynSoDSeYGU-k8ps3GEN1DZTaTJJMyqOIsopeJM0XiJ4eDPBDugS6LBphy1alm_i3Q702XYLEafCZv9oDDfRnh9rcwZK8pZJLzvZYe_4k6lrjjRQssAUVyiqQ0bqdN7xknvcMnf7tnvGbfHJpBBFqHGUlb0zXUuaonIcSQXnQAylfEigUDsYlJvirmgS_CUcigJ83_WH1ebaqfAAYxTDv2UgBWTh_uY6pLA5fBQLZJrJg=="
 
+# per-request id limits of the spotify web api
+TRACKS_BATCH = 50
+FEATS_BATCH = 100
+FETCH_WORKERS = 8
+FETCH_RETRIES = 5
+FETCH_BACKOFF = 0.5
+LOGIN_WORKERS = 4
+FIT_WORKERS = 2
+# slider events closer together than this only fit the last value
+FIT_DEBOUNCE = 0.15
+# refit in the background once this fraction of points was placed incrementally
+REFIT_FRAC = 0.05
+# neighbors precomputed per fit row, grown on demand by the slider
+GRAPH_K = 32
+# "brute", "kd_tree", "ball_tree", "ann" or "auto" to pick by size
+NEIGHBOR_BACKEND = os.environ.get("MUSIC_SPACE_NEIGHBORS", "auto")
+# below this many fit rows exact brute force is as fast as the approximate
+# index; kd/ball trees lose to brute force in the 12-d feature space
+ANN_MIN = 20000
+# buckets scanned per query by the approximate index
+ANN_PROBE = 8
+# songs listed next to the current track, and buckets probed per query
+SIMILAR_K = 10
+SIMILAR_PROBE = 16
+# added rows scanned exhaustively before they are sorted into buckets
+SIMILAR_TAIL = 2048
+# above this many tracks the feature plot ships box statistics, not raw values
+BOX_SUMMARY_MIN = int(os.environ.get("MUSIC_SPACE_BOX_SUMMARY", 5000))
+BOX_STATS = ["q1", "median", "q3", "lowerfence", "upperfence"]
+# embeddings remembered per (model, n_neighbors)
+EMBED_CACHE = 16
+# above this many fit rows isomap only computes geodesics from landmarks
+LANDMARK_MIN = 2000
+LANDMARKS = 256
+# no threads in the browser build
+IS_PYODIDE = sys.platform == "emscripten"
+# runtime without the fitting stack: precomputed embeddings and numpy box
+# statistics, scipy and scikit-learn are only loaded for an actual refit
+LITE = IS_PYODIDE or os.environ.get("MUSIC_SPACE_LITE", "") not in ("", "0")
+FIT_PACKAGES = ["scipy", "scikit-learn"]
+APP_FILE = os.path.abspath(globals().get("__file__", "app.py"))
+CACHE_PATH = os.environ.get(
+    "MUSIC_SPACE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "music-space", "tracks.sqlite"),
+)
+CACHE_TTL = 30 * 24 * 3600
+CACHE_SIZE = 200000
+TRACK_COLS = ["id", "name", "artist", "album", "image"]
+TRACK_CATS = ["lab", "member"]
+COMPS = ["comp0", "comp1", "comp2"]
+# precomputed payloads are zip (npz) archives, the old DATA is plain csv
+PAYLOAD_MAGIC = b"PK\x03\x04"
+PAYLOAD_FORMAT = 1
+# external data container: a json header line with the key salt, then one
+# fernet token per line, each a chunk of at most CHUNK_ROWS tracks
+CONTAINER_FORMAT = "music-space-chunks"
+CHUNK_ROWS = 20000
+DATA_PATH = os.environ.get(
+    "MUSIC_SPACE_DATA", os.path.join(os.path.dirname(APP_FILE), "data.enc")
+)
+SHARED_KEY = "music-space"
+# classes of the objects kept in the shared base
+SHARED_CLASSES = [
+    "AnnIndex",
+    "SimilarityIndex",
+    "NeighborGraph",
+    "LandmarkIsomap",
+    "ZStats",
+    "TrackStore",
+]
+# callback and stage timings in the prometheus text format on
+# http://127.0.0.1:<port>/metrics, not served when unset
+METRICS_PORT = int(os.environ.get("MUSIC_SPACE_METRICS_PORT", 0))
+METRICS_HOST = "127.0.0.1"
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 1 MB to 2 GB
+MEMORY_BUCKETS = tuple(2**i for i in range(20, 32))
+# fraction of callbacks run under cProfile, kept when slower than PROFILE_MIN
+# seconds and listed on /profiles
+PROFILE_RATE = float(os.environ.get("MUSIC_SPACE_PROFILE_RATE", 0))
+PROFILE_MIN = float(os.environ.get("MUSIC_SPACE_PROFILE_MIN", 1.0))
+PROFILE_KEEP = 20
+RE_TRACK = re.compile(
+    r"^(?:spotify:track:|(?:https?://)?open\.spotify\.com/(?:intl-[\w-]+/)?track/)?"
+    r"([0-9A-Za-z]{22})(?:[?/#].*)?$"
+)
+RE_PLAYLIST = re.compile(
+    r"^(?:spotify:playlist:|(?:https?://)?open\.spotify\.com/(?:intl-[\w-]+/)?"
+    r"playlist/)"
+    r"([0-9A-Za-z]{22})(?:[?/#].*)?$"
+)
+
 pn.extension("plotly", notifications=True)
 
 
+def shared_state():
+    # pn.state.cache outlives the per-session module runs of `panel serve`
+    return pn.state.cache.setdefault(
+        SHARED_KEY,
+        {"secret": os.urandom(32), "bases": dict(), "lock": threading.Lock()},
+    )
+
+
+def shared_executor():
+    # one worker pool per process, sized independently of the session count
+    state = shared_state()
+    with state["lock"]:
+        if "executor" not in state:
+            state["executor"] = ThreadPoolExecutor(
+                max_workers=LOGIN_WORKERS, thread_name_prefix="music-space"
+            )
+    return state["executor"]
+
+
+def shared_processes():
+    # model fits spend most of their time in GIL-holding scipy code, so
+    # they get their own processes rather than threads
+    state = shared_state()
+    with state["lock"]:
+        if "processes" not in state:
+            state["processes"] = ProcessPoolExecutor(
+                max_workers=FIT_WORKERS,
+                mp_context=mp.get_context("spawn"),
+                initializer=site.addsitedir,
+                initargs=(os.path.dirname(APP_FILE),),
+            )
+    return state["processes"]
+
+
+async def run_blocking(func, *args):
+    if IS_PYODIDE:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(shared_executor(), func, *args)
+
+
+async def run_in_process(func, *args):
+    # func must be picklable without this module, e.g. an estimator method
+    pool = None if IS_PYODIDE else shared_processes()
+    if pool is None:
+        return await run_blocking(func, *args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # workers could not start, e.g. no importable __main__ to spawn from
+        shared_state()["processes"] = None
+        return await run_blocking(func, *args)
+
+
+async def load_fit_packages():
+    # the lite browser build ships without the fitting stack, fetch it from
+    # the pyodide repository the first time a fit is needed
+    if importlib.util.find_spec("sklearn") is not None:
+        return
+    import micropip
+
+    await micropip.install(FIT_PACKAGES)
+
+
+class AppImport:
+    # pickles as a lookup in this file imported as a plain module: the module
+    # `panel serve` runs per session cannot be imported by worker processes
+    def __init__(self, name=None) -> None:
+        self.name = name
+
+    def __call__(self, *args):
+        return globals()[self.name](*args)
+
+    def __reduce__(self):
+        if self.name is None:
+            return importlib.import_module, (
+                os.path.splitext(os.path.basename(APP_FILE))[0],
+            )
+        return getattr, (AppImport(), self.name)
+
+
+class Metrics:
+    # process-wide histograms, counters and gauges, observed from the event
+    # loop and the worker threads alike
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.hists = dict()
+        self.values = dict()
+        self.profiles = deque(maxlen=PROFILE_KEEP)
+        self.profiling = False
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.hists:
+                # per-bucket counts, the last one past every bound; sum, count
+                self.hists[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+            hist = self.hists[key]
+            hist[1][bisect.bisect_left(hist[0], value)] += 1
+            hist[2] += value
+            hist[3] += 1
+
+    def add(self, name, delta=1, kind="counter", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = [kind, self.values.get(key, [kind, 0])[1] + delta]
+
+    def start_profile(self):
+        # one capture at a time: cProfile hooks the whole thread, and async
+        # callbacks interleave with others on the event loop while awaiting
+        if PROFILE_RATE <= 0 or random.random() >= PROFILE_RATE:
+            return None
+        with self.lock:
+            if self.profiling:
+                return None
+            self.profiling = True
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # another profiler is active in this thread
+            self.profiling = False
+            return None
+        return prof
+
+    def finish_profile(self, prof, name, elapsed):
+        prof.disable()
+        if elapsed >= PROFILE_MIN:
+            out = StringIO()
+            stats = pstats.Stats(prof, stream=out)
+            stats.sort_stats("cumulative").print_stats(30)
+            self.profiles.append(
+                "# {} {:.3f}s at {}\n{}".format(
+                    name, elapsed, time.strftime("%Y-%m-%dT%H:%M:%S"), out.getvalue()
+                )
+            )
+        self.profiling = False
+
+    def render(self):
+        with self.lock:
+            hists = {k: [h[0], list(h[1]), h[2], h[3]] for k, h in self.hists.items()}
+            values = {k: list(v) for k, v in self.values.items()}
+        rss = process_rss()
+        if rss is not None:
+            values[("music_space_process_rss_bytes", ())] = ["gauge", rss]
+        lines, typed = [], set()
+        for (name, labels), (buckets, counts, total, count) in sorted(hists.items()):
+            if name not in typed:
+                lines.append("# TYPE {} histogram".format(name))
+                typed.add(name)
+            cum = np.cumsum(counts)
+            for le, c in zip([repr(float(b)) for b in buckets] + ["+Inf"], cum):
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        name, format_labels(labels + (("le", le),)), c
+                    )
+                )
+            lines.append("{}_sum{} {!r}".format(name, format_labels(labels), total))
+            lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+        for (name, labels), (kind, value) in sorted(values.items()):
+            if name not in typed:
+                lines.append("# TYPE {} {}".format(name, kind))
+                typed.add(name)
+            lines.append("{}{} {}".format(name, format_labels(labels), value))
+        return "\n".join(lines) + "\n"
+
+    def render_profiles(self):
+        return "\n".join(reversed(self.profiles)) or "no slow callbacks profiled\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(",".join('{}="{}"'.format(k, v) for k, v in labels))
+
+
+def process_rss():
+    try:
+        with open("/proc/self/statm") as statf:
+            return int(statf.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def serve_metrics(registry, port, host=METRICS_HOST):
+    # plain http next to the bokeh server, local only: scrape it on the host
+    # or through a tunnel
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = registry.render()
+            elif self.path == "/profiles":
+                body = registry.render_profiles()
+            else:
+                return self.send_error(404)
+            body = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="music-space-metrics", daemon=True
+    ).start()
+    return server
+
+
+def persistent(name):
+    # `panel serve` clears the globals of the per-session module when its
+    # session ends, objects outliving it come from this file imported once
+    # as a plain module
+    if not __name__.startswith("bokeh_app"):
+        return globals()[name]
+    mod_name = os.path.splitext(os.path.basename(APP_FILE))[0]
+    module = sys.modules.get(mod_name)
+    if getattr(module, "APP_FILE", None) != APP_FILE:
+        spec = importlib.util.spec_from_file_location(mod_name, APP_FILE)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[mod_name] = module
+        spec.loader.exec_module(module)
+    return getattr(module, name)
+
+
+def metrics():
+    state = shared_state()
+    if "metrics" not in state:
+        with state["lock"]:
+            if "metrics" not in state:
+                state["metrics"] = persistent("Metrics")()
+                if METRICS_PORT and not IS_PYODIDE:
+                    try:
+                        state["metrics_server"] = persistent("serve_metrics")(
+                            state["metrics"], METRICS_PORT
+                        )
+                    except OSError as err:
+                        # e.g. another `panel serve --num-procs` worker has it
+                        warnings.warn("Not serving metrics: {}".format(err))
+    return state["metrics"]
+
+
+# stages open in the current task or thread, so a stage nested in one of the
+# same name, e.g. a patch falling back to a new figure, is timed once
+STAGES = contextvars.ContextVar("music_space_stages", default=frozenset())
+
+
+@contextlib.contextmanager
+def stage(name):
+    # wall time of one step of a callback, as a block or a method decorator
+    active = STAGES.get()
+    if name in active:
+        yield
+        return
+    token = STAGES.set(active | {name})
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGES.reset(token)
+        metrics().observe(
+            "music_space_stage_seconds", time.perf_counter() - t0, stage=name
+        )
+
+
+def instrument(name):
+    # times a session callback, counts its failures and samples the session
+    # memory afterwards; async callbacks stay coroutine functions for param
+    def finish(ms, prof, t0, failed):
+        elapsed = time.perf_counter() - t0
+        registry = metrics()
+        if prof is not None:
+            registry.finish_profile(prof, name, elapsed)
+        registry.observe("music_space_callback_seconds", elapsed, callback=name)
+        if failed:
+            registry.add("music_space_callback_errors_total", callback=name)
+        registry.observe(
+            "music_space_session_bytes", ms.memory_bytes(), buckets=MEMORY_BUCKETS
+        )
+
+    def wrap(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def timed(self, *args):
+                prof, t0, failed = metrics().start_profile(), time.perf_counter(), True
+                try:
+                    out = await func(self, *args)
+                    failed = False
+                    return out
+                finally:
+                    finish(self, prof, t0, failed)
+
+        else:
+
+            @functools.wraps(func)
+            def timed(self, *args):
+                prof, t0, failed = metrics().start_profile(), time.perf_counter(), True
+                try:
+                    out = func(self, *args)
+                    failed = False
+                    return out
+                finally:
+                    finish(self, prof, t0, failed)
+
+        return timed
+
+    return wrap
+
+
+def build_session(
+    pool_size=FETCH_WORKERS, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF
+):
+    # retry on 429/5xx with exponential backoff, honoring Retry-After
+    retry = Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_batched(func, items, batch_size, workers=FETCH_WORKERS):
+    items = list(items)
+    batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+    if workers > 1 and len(batches) > 1 and not IS_PYODIDE:
+        # map returns results in submission order
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            results = list(pool.map(func, batches))
+    else:
+        results = [func(b) for b in batches]
+    return list(itt.chain.from_iterable(results))
+
+
+def uri_to_id(uri):
+    match = RE_TRACK.match(uri.strip())
+    if match is None:
+        raise ValueError("Invalid Spotify URI: {}".format(uri))
+    return match.group(1)
+
+
+def make_record(track, feat):
+    im = track["album"]["images"]
+    imsize = [i["width"] for i in im]
+    rec = {
+        "id": track["id"],
+        "name": track["name"],
+        "artist": track["artists"][0]["name"],
+        "album": track["album"]["name"],
+        "image": im[np.argmax(imsize)]["url"],
+    }
+    rec.update({fn: feat[fn] for fn in FEATS})
+    return rec
+
+
+def pack_strings(values):
+    enc = [str(v).encode("utf-8") for v in values]
+    offsets = np.concatenate([[0], np.cumsum([len(e) for e in enc])])
+    return np.frombuffer(b"".join(enc), dtype=np.uint8), offsets.astype(np.int64)
+
+
+def unpack_strings(blob, offsets):
+    raw = blob.tobytes()
+    return np.array(
+        [raw[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])],
+        dtype=object,
+    )
+
+
+def pack_payload(data, feats, zstats, embeds, meta):
+    # columnar npz: strings as utf-8 blobs with offsets, features, z-scores
+    # and one embedding per n_neighbors as float32, no pickles
+    str_cols = [c for c in ["lab", "member", "uri"] + TRACK_COLS if c in data]
+    arrays = {
+        "feats": data[feats].to_numpy(dtype=np.float32),
+        "z": data[[f + "-z" for f in feats]].to_numpy(dtype=np.float32),
+        "zstats": np.vstack([zstats.mean, zstats.m2]),
+    }
+    for c in str_cols:
+        arrays["str__{}__data".format(c)], arrays["str__{}__offsets".format(c)] = (
+            pack_strings(data[c])
+        )
+    for k, comps in embeds.items():
+        arrays["embed__{}".format(k)] = np.asarray(comps, dtype=np.float32)
+    meta = dict(
+        meta,
+        format=PAYLOAD_FORMAT,
+        feats=list(feats),
+        columns=str_cols,
+        n_neighbors=list(embeds),
+        zstats_n=zstats.n,
+    )
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+    buf = BytesIO()
+    np.savez_compressed(buf, **arrays)
+    return buf.getvalue()
+
+
+def read_payload(raw):
+    npz = np.load(BytesIO(raw), allow_pickle=False)
+    meta = json.loads(npz["meta"].tobytes().decode("utf-8"))
+    if meta.get("format") != PAYLOAD_FORMAT:
+        raise ValueError("Unsupported data format: {}".format(meta.get("format")))
+    data = pd.DataFrame(
+        {
+            c: unpack_strings(
+                npz["str__{}__data".format(c)], npz["str__{}__offsets".format(c)]
+            )
+            for c in meta["columns"]
+        }
+    )
+    feats = meta["feats"]
+    data[feats] = npz["feats"]
+    data[[f + "-z" for f in feats]] = npz["z"]
+    zstats = ZStats(len(feats))
+    zstats.n, (zstats.mean, zstats.m2) = meta["zstats_n"], npz["zstats"]
+    embeds = {k: npz["embed__{}".format(k)] for k in meta["n_neighbors"]}
+    return data, zstats, embeds, meta
+
+
+def pack_chunks(data, feats, zstats, embeds, meta, rows=CHUNK_ROWS):
+    return [
+        pack_payload(
+            data.iloc[i : i + rows],
+            feats,
+            zstats,
+            {k: comps[i : i + rows] for k, comps in embeds.items()},
+            dict(meta, rows=len(data)),
+        )
+        for i in range(0, max(len(data), 1), rows)
+    ]
+
+
+def pack_container(fernet, salt, app_id, app_secret, chunks):
+    # lines of the container file. every chunk starts with its index and the
+    # chunk count, so dropped, reordered or appended chunks are detected
+    header = {
+        "format": CONTAINER_FORMAT,
+        "salt": salt.hex(),
+        "app_id": fernet.encrypt(app_id.encode("utf-8")).decode("ascii"),
+        "app_secret": fernet.encrypt(app_secret.encode("utf-8")).decode("ascii"),
+        "chunks": len(chunks),
+    }
+    yield json.dumps(header) + "\n"
+    for i, chunk in enumerate(chunks):
+        token = fernet.encrypt(struct.pack("<II", i, len(chunks)) + chunk)
+        yield token.decode("ascii") + "\n"
+
+
+def data_lines(path):
+    if path and os.path.exists(path):
+        with open(path, "r") as dataf:
+            yield from dataf
+    elif path and IS_PYODIDE:
+        # the browser build fetches it from next to the page
+        from pyodide.http import open_url
+
+        try:
+            lines = open_url(os.path.basename(path))
+        except Exception:
+            # nothing deployed, fall back to the module constants
+            return
+        yield from lines
+
+
+def open_container(path=None):
+    # header and a lazy iterator over the chunk tokens; without a container
+    # file the module constants act as a single unnumbered chunk
+    lines = data_lines(path)
+    line = next(lines, "")
+    if not line.startswith("{"):
+        lines.close()
+        return {"salt": KEY_SALT, "app_id": APP_ID, "app_secret": APP_SECRET}, None
+    header = json.loads(line)
+    if header.get("format") != CONTAINER_FORMAT:
+        raise ValueError("Unsupported data container: {}".format(header.get("format")))
+    header["salt"] = bytes.fromhex(header["salt"])
+    header["app_id"] = header["app_id"].encode("ascii")
+    header["app_secret"] = header["app_secret"].encode("ascii")
+    return header, (l.strip().encode("ascii") for l in lines if l.strip())
+
+
+def decrypt_chunks(fernet, tokens, n_chunks):
+    # one chunk in clear at a time, as the consumer pulls it
+    i = -1
+    for i, token in enumerate(tokens):
+        raw = fernet.decrypt(token)
+        if struct.unpack("<II", raw[:8]) != (i, n_chunks):
+            raise ValueError("Corrupted data chunk {}".format(i))
+        yield raw[8:]
+    if i + 1 != n_chunks:
+        raise ValueError("Truncated data: {} of {} chunks".format(i + 1, n_chunks))
+
+
+def align(comps, ref):
+    # best rotation/reflection onto the previous embedding so points keep
+    # their place when n_neighbors changes
+    mu, mu_ref = comps.mean(0), ref.mean(0)
+    # orthogonal procrustes, without importing scipy for it
+    u, _, vt = np.linalg.svd((comps - mu).T @ (ref - mu_ref))
+    rot = u @ vt
+    return (comps - mu) @ rot + mu_ref
+
+
+def box_stats(values, codes):
+    # tukey box statistics of every (group, column) at once: sort each column
+    # within groups and interpolate the quartiles at fractional ranks, the
+    # same "linear" method plotly uses client side (Lib.interp: rank q*n-0.5
+    # clamped to the group)
+    idx = np.argsort(values, axis=0)
+    idx = np.take_along_axis(idx, np.argsort(codes[idx], axis=0, kind="stable"), 0)
+    srt = np.take_along_axis(values, idx, axis=0)
+    counts = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    cols = np.arange(values.shape[1])
+
+    def quantile(q):
+        rank = np.clip(q * counts - 0.5, 0, counts - 1)
+        pos = (starts + rank)[:, None] + np.zeros(len(cols))
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, (starts + counts - 1)[:, None])
+        return srt[lo, cols] + (pos - lo) * (srt[hi, cols] - srt[lo, cols])
+
+    stats = {"q1": quantile(0.25), "median": quantile(0.5), "q3": quantile(0.75)}
+    iqr = stats["q3"] - stats["q1"]
+    lo, hi = stats["q1"] - 1.5 * iqr, stats["q3"] + 1.5 * iqr
+    # whiskers end at the most extreme values inside the fences, never inside
+    # the box
+    stats["lowerfence"] = np.minimum(
+        stats["q1"],
+        np.minimum.reduceat(
+            np.where(srt >= np.repeat(lo, counts, axis=0), srt, np.inf), starts
+        ),
+    )
+    stats["upperfence"] = np.maximum(
+        stats["q3"],
+        np.maximum.reduceat(
+            np.where(srt <= np.repeat(hi, counts, axis=0), srt, -np.inf), starts
+        ),
+    )
+    stats["outliers"] = (values < lo[codes]) | (values > hi[codes])
+    return stats
+
+
+def neighbor_algorithm(backend, n):
+    if backend == "auto":
+        return "brute" if n < ANN_MIN else "ann"
+    if backend not in ("brute", "kd_tree", "ball_tree", "ann"):
+        raise ValueError("Unknown neighbor backend: {}".format(backend))
+    return backend
+
+
+class AnnIndex:
+    # inverted file: rows are bucketed by their nearest k-means centroid and
+    # the neighbors of a row are searched in the buckets closest to its own
+    def __init__(self, n_lists=None, n_probe=ANN_PROBE, n_iter=10, seed=0) -> None:
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+
+    @staticmethod
+    def assign(X, centers, chunk=4096):
+        c2 = (centers**2).sum(axis=1)
+        return np.concatenate(
+            [
+                (c2 - 2 * X[i : i + chunk] @ centers.T).argmin(axis=1)
+                for i in range(0, len(X), chunk)
+            ]
+        )
+
+    def dists(self, X):
+        # squared distances to the centroids, up to a per-row constant
+        return (self.centers_**2).sum(axis=1) - 2 * X @ self.centers_.T
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=float)
+        n = len(X)
+        n_lists = min(self.n_lists or max(int(np.sqrt(n)), 1), n)
+        rng = np.random.default_rng(self.seed)
+        centers = X[rng.choice(n, n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = self.assign(X, centers)
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, X)
+            keep = counts > 0
+            centers[keep] = sums[keep] / counts[keep, None]
+        labels = self.assign(X, centers)
+        self.X_ = X
+        self.centers_ = centers
+        self.order_ = np.argsort(labels, kind="stable")
+        self.bounds_ = np.searchsorted(labels[self.order_], np.arange(n_lists + 1))
+        return self
+
+    def kneighbors(self, k):
+        # neighbors of the indexed rows themselves, excluding each row: every
+        # row probes its closest buckets, scanned one bucket at a time
+        X, order, bounds = self.X_, self.order_, self.bounds_
+        n = len(X)
+        x2 = (X**2).sum(axis=1)
+        n_probe = min(self.n_probe, len(self.centers_))
+        probes = np.concatenate(
+            [
+                np.argpartition(self.dists(X[i : i + 4096]), n_probe - 1, axis=1)[
+                    :, :n_probe
+                ]
+                for i in range(0, n, 4096)
+            ]
+        )
+        dist = np.full((n, k), np.inf)
+        ind = np.zeros((n, k), dtype=int)
+        by_bucket = np.argsort(probes.ravel(), kind="stable") // n_probe
+        starts = np.searchsorted(
+            np.sort(probes.ravel()), np.arange(len(self.centers_) + 1)
+        )
+        for c in range(len(self.centers_)):
+            rows = by_bucket[starts[c] : starts[c + 1]]
+            members = order[bounds[c] : bounds[c + 1]]
+            if not len(rows) or not len(members):
+                continue
+            d2 = x2[rows, None] + x2[None, members] - 2 * X[rows] @ X[members].T
+            d2[rows[:, None] == members[None, :]] = np.inf
+            d2 = np.hstack([dist[rows], d2])
+            cand = np.hstack(
+                [ind[rows], np.broadcast_to(members, (len(rows), len(members)))]
+            )
+            top = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            dist[rows] = np.take_along_axis(d2, top, axis=1)
+            ind[rows] = np.take_along_axis(cand, top, axis=1)
+        # rows whose probed buckets held fewer than k others are searched fully
+        miss = np.flatnonzero(np.isinf(dist[:, -1]))
+        if len(miss):
+            d2 = x2[miss, None] + x2[None, :] - 2 * X[miss] @ X.T
+            d2[np.arange(len(miss)), miss] = np.inf
+            ind[miss] = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            dist[miss] = np.take_along_axis(d2, ind[miss], axis=1)
+        srt = np.argsort(dist, axis=1)
+        dist = np.sqrt(np.maximum(np.take_along_axis(dist, srt, axis=1), 0))
+        return dist, np.take_along_axis(ind, srt, axis=1)
+
+
+class SimilarityIndex:
+    # nearest tracks to one query at a time: below ANN_MIN a scan, above it an
+    # inverted file like AnnIndex, stored bucket by bucket so a query reads
+    # contiguous slices. added rows are scanned as a tail until there are
+    # enough of them to be bucketed. adding returns a new index and leaves
+    # this one untouched, so sessions can share one through the base
+    def __init__(self, X, centers=None, n_probe=SIMILAR_PROBE) -> None:
+        self.X = np.asarray(X, dtype=np.float32)
+        self.x2 = (self.X**2).sum(axis=1)
+        self.n_probe = n_probe
+        if centers is None and len(self.X) >= ANN_MIN:
+            centers = AnnIndex().fit(self.X).centers_
+        self.centers = None if centers is None else centers.astype(np.float32)
+        self.n_sorted = 0
+        if self.centers is not None:
+            self.c2 = (self.centers**2).sum(axis=1)
+            self.labels = AnnIndex.assign(self.X, self.centers)
+            self.layout()
+
+    def __len__(self):
+        return len(self.X)
+
+    def layout(self):
+        n = len(self.labels)
+        self.order = np.argsort(self.labels, kind="stable")
+        self.bounds = np.searchsorted(
+            self.labels[self.order], np.arange(len(self.centers) + 1)
+        )
+        self.X_sorted = self.X[self.order]
+        self.x2_sorted = self.x2[self.order]
+        self.n_sorted = n
+
+    def add(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        new = SimilarityIndex.__new__(SimilarityIndex)
+        new.__dict__.update(self.__dict__)
+        new.X = np.vstack([self.X, X])
+        new.x2 = np.concatenate([self.x2, (X**2).sum(axis=1)])
+        if self.centers is not None:
+            new.labels = np.concatenate([self.labels, AnnIndex.assign(X, self.centers)])
+            if len(new.X) - new.n_sorted > max(SIMILAR_TAIL, len(new.X) // 50):
+                new.layout()
+        return new
+
+    def query(self, x, k):
+        x = np.asarray(x, dtype=np.float32)
+        k = min(k, len(self.X))
+        if self.centers is None:
+            d2 = self.x2 - 2 * self.X @ x
+            rows = None
+        else:
+            n_probe = min(self.n_probe, len(self.centers))
+            probes = np.argpartition(self.c2 - 2 * self.centers @ x, n_probe - 1)
+            parts = [
+                slice(self.bounds[c], self.bounds[c + 1]) for c in probes[:n_probe]
+            ]
+            tail = slice(self.n_sorted, len(self.X))
+            d2 = np.concatenate(
+                [self.x2_sorted[p] - 2 * self.X_sorted[p] @ x for p in parts]
+                + [self.x2[tail] - 2 * self.X[tail] @ x]
+            )
+            rows = np.concatenate(
+                [self.order[p] for p in parts] + [np.arange(tail.start, tail.stop)]
+            )
+            if len(rows) < k:
+                d2, rows = self.x2 - 2 * self.X @ x, None
+        top = np.argpartition(d2, k - 1)[:k]
+        top = top[np.argsort(d2[top])]
+        dist = np.sqrt(np.maximum(d2[top] + x @ x, 0))
+        return dist, top if rows is None else rows[top]
+
+
+class NeighborGraph:
+    # sorted neighbor lists of the fit rows, computed once and sliced for any k
+    def __init__(self, X, version=None, k=GRAPH_K, backend="auto") -> None:
+        self.X = np.asarray(X, dtype=float)
+        self.version = version
+        self.backend = backend
+        self.algorithm = neighbor_algorithm(backend, len(self.X))
+        self.index = None
+        self.lock = threading.Lock()
+        self.connected = dict()
+        self.k_cap = 0
+        self.extend(k)
+
+    def extend(self, k):
+        n = len(self.X)
+        k = min(max(k, 2 * self.k_cap), n - 1)
+        if self.index is None and self.algorithm == "ann":
+            self.index = AnnIndex().fit(self.X)
+        elif self.index is None:
+            from sklearn.neighbors import NearestNeighbors
+
+            self.index = NearestNeighbors(algorithm=self.algorithm).fit(self.X)
+        if self.algorithm == "ann":
+            dist, ind = self.index.kneighbors(k)
+        else:
+            dist, ind = self.index.kneighbors(n_neighbors=k)
+        # rows start with the point itself, as sklearn expects of
+        # precomputed neighbor graphs
+        self.dist = np.hstack([np.zeros((n, 1)), dist])
+        self.ind = np.hstack([np.arange(n)[:, None], ind])
+        self.k_cap = k
+
+    def graph(self, k):
+        from scipy.sparse import csr_matrix
+
+        with self.lock:
+            if k > self.k_cap:
+                self.extend(k)
+            dist, ind = self.dist[:, : k + 1], self.ind[:, : k + 1]
+        n, w = dist.shape
+        return csr_matrix(
+            (dist.ravel(), ind.ravel(), np.arange(0, n * w + 1, w)), shape=(n, n)
+        )
+
+    def is_connected(self, k):
+        if k not in self.connected:
+            from scipy.sparse.csgraph import connected_components
+
+            ncomp, _ = connected_components(self.graph(k), directed=False)
+            self.connected[k] = ncomp == 1
+        return self.connected[k]
+
+    def bridged(self, k):
+        # link every stray component to the largest one through its closest
+        # pair of points, keeping zero-distance duplicates as edges
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+        from scipy.spatial import cKDTree
+
+        graph = self.graph(k)
+        graph.data = np.maximum(graph.data, 1e-12)
+        ncomp, labels = connected_components(graph, directed=False)
+        if ncomp == 1:
+            return graph
+        main = np.bincount(labels).argmax()
+        main_idx = np.flatnonzero(labels == main)
+        tree = cKDTree(self.X[main_idx])
+        rows, cols, vals = [], [], []
+        for c in range(ncomp):
+            if c == main:
+                continue
+            members = np.flatnonzero(labels == c)
+            d, j = tree.query(self.X[members])
+            best = d.argmin()
+            rows.append(members[best])
+            cols.append(main_idx[j[best]])
+            vals.append(max(d[best], 1e-12))
+        return graph + csr_matrix((vals, (rows, cols)), shape=graph.shape)
+
+
+class LandmarkIsomap:
+    # landmark isomap (de Silva & Tenenbaum, 2003): geodesics are computed
+    # from a few landmarks only, O(m n log n) instead of O(n^2 log n)
+    def __init__(self, n_neighbors=5, n_components=3, n_landmarks=LANDMARKS):
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.n_landmarks = n_landmarks
+
+    def fit(self, graph):
+        from scipy.linalg import eigh
+        from scipy.sparse.csgraph import shortest_path
+
+        n = graph.shape[0]
+        rng = np.random.default_rng(0)
+        lm = np.sort(rng.choice(n, min(self.n_landmarks, n), replace=False))
+        dist = shortest_path(graph, directed=False, indices=lm).astype(np.float32)
+        # classical mds on the landmarks
+        d2 = dist[:, lm].astype(float) ** 2
+        self.mean_d2_ = d2.mean(1)
+        cent = d2 - self.mean_d2_[:, None]
+        cent = cent - cent.mean(0)[None, :]
+        evals, evecs = eigh(-0.5 * cent)
+        top = np.argsort(evals)[::-1][: self.n_components]
+        self.proj_ = evecs[:, top] / np.sqrt(np.maximum(evals[top], 1e-12))
+        self.landmarks_ = lm
+        self.dist_ = dist
+        self.embedding_ = self.triangulate(dist.astype(float) ** 2)
+        return self
+
+    def triangulate(self, d2):
+        return -0.5 * (d2 - self.mean_d2_[:, None]).T @ self.proj_
+
+    def transform(self, dist):
+        # dist holds distances from new points to every fit point; geodesics
+        # to landmarks go through the nearest fit points
+        k = min(self.n_neighbors, dist.shape[1])
+        nn = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        dnn = np.take_along_axis(dist, nn, axis=1)
+        geo = (dnn[:, None, :] + self.dist_[:, nn].transpose(1, 0, 2)).min(2)
+        return self.triangulate(geo.T**2)
+
+
+def fit_landmark(graph, n_neighbors, n_components, n_landmarks):
+    # runs in the worker processes, the caller adopts the fitted state
+    return vars(LandmarkIsomap(n_neighbors, n_components, n_landmarks).fit(graph))
+
+
+class TrackCache:
+    # sqlite store of track records keyed by spotify track id
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_size=CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "id TEXT PRIMARY KEY, record TEXT, fetched REAL, accessed REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS tracks_accessed ON tracks (accessed)"
+            )
+
+    @classmethod
+    def open(cls, **kwargs):
+        if sqlite3 is None:
+            return None
+        try:
+            return cls(**kwargs)
+        except (OSError, sqlite3.Error):
+            return None
+
+    def get(self, ids):
+        now = time.time()
+        ids = list(dict.fromkeys(ids))
+        recs = dict()
+        with self.lock, self.conn:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    "SELECT id, record FROM tracks WHERE id IN ({}) AND fetched > ?".format(
+                        marks
+                    ),
+                    chunk + [now - self.ttl],
+                ).fetchall()
+                hits = []
+                for tid, rec in rows:
+                    rec = json.loads(rec)
+                    # records written with a different feature set are misses
+                    if all(fn in rec for fn in FEATS):
+                        recs[tid] = rec
+                        hits.append(tid)
+                if hits:
+                    self.conn.execute(
+                        "UPDATE tracks SET accessed = ? WHERE id IN ({})".format(
+                            ",".join("?" * len(hits))
+                        ),
+                        [now] + hits,
+                    )
+        return recs
+
+    def put(self, recs):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?)",
+                [(tid, json.dumps(rec), now, now) for tid, rec in recs.items()],
+            )
+            self.evict(now)
+
+    def evict(self, now):
+        self.conn.execute("DELETE FROM tracks WHERE fetched <= ?", (now - self.ttl,))
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()
+        if count > self.max_size:
+            self.conn.execute(
+                "DELETE FROM tracks WHERE id IN "
+                "(SELECT id FROM tracks ORDER BY accessed LIMIT ?)",
+                (count - self.max_size,),
+            )
+
+
+class ZStats:
+    # mean and sum of squared deviations of the reference rows, merged batch
+    # by batch (Chan et al.'s parallel form of Welford's update)
+    def __init__(self, n_feats) -> None:
+        self.n = 0
+        self.mean = np.zeros(n_feats)
+        self.m2 = np.zeros(n_feats)
+
+    @classmethod
+    def from_values(cls, X):
+        return cls(X.shape[1]).update(X)
+
+    def update(self, X):
+        X = np.asarray(X, dtype=float)
+        n_b = len(X)
+        if n_b == 0:
+            return self
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / n
+        self.m2 = self.m2 + m2_b + delta**2 * self.n * n_b / n
+        self.n = n
+        return self
+
+    def copy(self):
+        new = ZStats(len(self.mean))
+        new.n, new.mean, new.m2 = self.n, self.mean.copy(), self.m2.copy()
+        return new
+
+    @property
+    def std(self):
+        # sample std, as pandas computed it
+        return np.sqrt(self.m2 / (self.n - 1))
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean) / self.std
+
+
+class TrackStore:
+    # columnar track table: numeric columns share one float32 matrix, lab and
+    # member are category codes and everything else plain arrays. all of them
+    # keep spare rows so appends fill capacity instead of copying the table,
+    # and copies share arrays until one side writes to them
+    def __init__(self) -> None:
+        self.n = 0
+        self.order = []
+        self.num = dict()
+        self.mat = np.empty((0, 0), dtype=np.float32)
+        self.codes = dict()
+        self.cats = dict()
+        self.cols = dict()
+        self.owned = set()
+        self.version = 0
+        self.annot_version = 0
+        self.views = dict()
+
+    @classmethod
+    def from_frame(cls, df, num=(), cats=TRACK_CATS):
+        store = cls()
+        store.n = len(df)
+        store.order = list(df.columns) + [c for c in num if c not in df]
+        num = [c for c in store.order if c in num]
+        # integer columns go to the matrix too, as in add_column: appended
+        # rows without them get nan
+        num += [
+            c
+            for c in df.columns
+            if c not in num and c not in cats and df[c].dtype.kind in "fiu"
+        ]
+        store.num = {c: j for j, c in enumerate(num)}
+        store.mat = np.full((store.n, len(num)), np.nan, dtype=np.float32)
+        for c, j in store.num.items():
+            if c in df:
+                store.mat[:, j] = df[c].to_numpy(dtype=np.float32)
+        for c in cats:
+            if c in df:
+                codes, uniq = pd.factorize(df[c])
+                store.codes[c] = codes.astype(np.int32)
+                store.cats[c] = {v: i for i, v in enumerate(uniq)}
+        for c in df.columns:
+            if c not in store.num and c not in store.codes:
+                # flags stay bool, anything else is held as objects so
+                # missing values can be None
+                arr = df[c].to_numpy()
+                store.cols[c] = arr.copy() if arr.dtype == bool else arr.astype(object)
+        store.owned = store.keys()
+        return store
+
+    def __len__(self):
+        return self.n
+
+    def keys(self):
+        return (
+            {"mat"}
+            | set(self.codes)
+            | {"cats:" + c for c in self.cats}
+            | set(self.cols)
+        )
+
+    def copy(self):
+        # both sides give up ownership, the first write to a shared array
+        # copies it
+        new = TrackStore()
+        new.__dict__.update(self.__dict__)
+        for attr in ["order", "num", "codes", "cats", "cols"]:
+            setattr(new, attr, getattr(self, attr).copy())
+        new.views = dict()
+        self.owned, new.owned = set(), set()
+        return new
+
+    def own(self, key):
+        if key in self.owned:
+            return
+        if key == "mat":
+            self.mat = self.mat.copy()
+        elif key.startswith("cats:"):
+            self.cats[key[5:]] = dict(self.cats[key[5:]])
+        elif key in self.codes:
+            self.codes[key] = self.codes[key].copy()
+        else:
+            self.cols[key] = self.cols[key].copy()
+        self.owned.add(key)
+
+    def nbytes(self):
+        # array buffers this store owns, not the ones still shared with copies
+        size = 0
+        for key in self.owned:
+            if key == "mat":
+                size += self.mat.nbytes
+            elif key in self.codes:
+                size += self.codes[key].nbytes
+            elif key in self.cols:
+                size += self.cols[key].nbytes
+        return size
+
+    def reserve(self, n):
+        # grow every array to at least n rows, doubling to keep appends
+        # amortized O(1) per row
+        cap = len(self.mat)
+        if n <= cap:
+            return
+        cap = max(n, 2 * cap, 16)
+        mat = np.full((cap, self.mat.shape[1]), np.nan, dtype=np.float32)
+        mat[: self.n] = self.mat[: self.n]
+        self.mat = mat
+        for c, arr in self.codes.items():
+            self.codes[c] = np.full(cap, -1, dtype=np.int32)
+            self.codes[c][: self.n] = arr[: self.n]
+        for c, arr in self.cols.items():
+            self.cols[c] = np.full(cap, False if arr.dtype == bool else None, arr.dtype)
+            self.cols[c][: self.n] = arr[: self.n]
+        self.owned |= {"mat"} | set(self.codes) | set(self.cols)
+
+    def encode(self, c, values):
+        self.own("cats:" + c)
+        cats = self.cats[c]
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            if pd.isna(v):
+                codes[i] = -1
+            else:
+                codes[i] = cats.setdefault(v, len(cats))
+        return codes
+
+    def append(self, recs):
+        n, m = self.n, len(recs)
+        self.reserve(n + m)
+        for key in self.keys():
+            self.own(key)
+        rows = slice(n, n + m)
+        for c, j in self.num.items():
+            self.mat[rows, j] = [r.get(c, np.nan) for r in recs]
+        for c in self.codes:
+            self.codes[c][rows] = self.encode(c, [r.get(c) for r in recs])
+        for c, arr in self.cols.items():
+            default = False if arr.dtype == bool else None
+            arr[rows] = [r.get(c, default) for r in recs]
+        self.n += m
+        self.touch(annot=True)
+
+    def extend(self, df):
+        # columnar append of a frame with the same columns, e.g. a data chunk
+        n, m = self.n, len(df)
+        self.reserve(n + m)
+        for key in self.keys():
+            self.own(key)
+        rows = slice(n, n + m)
+        for c, j in self.num.items():
+            self.mat[rows, j] = df[c].to_numpy(dtype=np.float32) if c in df else np.nan
+        for c in self.codes:
+            self.codes[c][rows] = self.encode(c, df[c].to_numpy())
+        for c, arr in self.cols.items():
+            arr[rows] = df[c].to_numpy() if c in df else arr.dtype.type()
+        self.n += m
+        self.touch(annot=True)
+
+    def values(self, cols, rows=None):
+        rows = slice(0, self.n) if rows is None else rows
+        return self.mat[rows][:, [self.num[c] for c in cols]].astype(float)
+
+    def set_values(self, cols, values, rows=None):
+        # write a block of numeric columns at once
+        self.own("mat")
+        rows = np.arange(self.n) if rows is None else np.asarray(rows)
+        self.mat[rows[:, None], [self.num[c] for c in cols]] = values
+        self.touch()
+
+    def set(self, c, values, rows=None):
+        rows = slice(0, self.n) if rows is None else rows
+        if c in self.num:
+            self.own("mat")
+            self.mat[rows, self.num[c]] = values
+        elif c in self.codes:
+            self.own(c)
+            values = np.broadcast_to(np.asarray(values, dtype=object), (self.n,))
+            self.codes[c][rows] = self.encode(c, values[rows])
+        elif c in self.cols:
+            self.own(c)
+            self.cols[c][rows] = values
+        else:
+            self.add_column(c, values, rows)
+        self.touch(annot=c == "annot")
+
+    def add_column(self, c, values, rows):
+        arr = np.asarray(values)
+        cap = len(self.mat)
+        if arr.dtype.kind in "fiu":
+            self.mat = np.hstack([self.mat, np.full((cap, 1), np.nan, np.float32)])
+            self.num[c] = self.mat.shape[1] - 1
+            self.owned.add("mat")
+            self.mat[rows, self.num[c]] = arr
+        else:
+            dtype = bool if arr.dtype == bool else object
+            self.cols[c] = np.full(cap, False if dtype is bool else None, dtype)
+            self.cols[c][rows] = arr
+            self.owned.add(c)
+        self.order.append(c)
+
+    def touch(self, annot=False):
+        self.version += 1
+        if annot:
+            self.annot_version += 1
+
+    def column(self, c):
+        if c in self.num:
+            return self.mat[: self.n, self.num[c]]
+        if c in self.codes:
+            # categories only ever grow, so their count identifies the dtype
+            key = "dtype:" + c, len(self.cats[c])
+            if self.views.get(key[0], (None,))[0] != key[1]:
+                cats = pd.Index(list(self.cats[c]), dtype=object)
+                self.views[key[0]] = key[1], pd.CategoricalDtype(cats)
+            return pd.Categorical.from_codes(
+                self.codes[c][: self.n], dtype=self.views[key[0]][1]
+            )
+        arr = self.cols[c][: self.n]
+        if arr.dtype == object:
+            # explicit dtype skips pandas' string inference, which copies
+            return pd.Series(arr, dtype=object, copy=False)
+        return arr
+
+    def take(self, cols, rows):
+        # a few rows as their own frame, without the full view
+        return pd.DataFrame(
+            {
+                c: (
+                    self.column(c)[rows]
+                    if c in self.num or c in self.codes
+                    else self.cols[c][rows]
+                )
+                for c in cols
+            },
+            index=rows,
+        )
+
+    def frame(self):
+        # zero-copy pandas view, rebuilt only after a write
+        if self.views.get("frame", (None,))[0] != self.version:
+            df = pd.DataFrame({c: self.column(c) for c in self.order}, copy=False)
+            self.views["frame"] = self.version, df
+        return self.views["frame"][1]
+
+    def rows(self, which="org"):
+        # cached positions of the original or annotated rows
+        key = which, self.n, self.annot_version
+        if self.views.get(which, (None,))[0] != key:
+            annot = self.cols["annot"][: self.n]
+            self.views[which] = key, np.flatnonzero(
+                annot if which == "annot" else ~annot
+            )
+        return self.views[which][1]
+
+    def subset(self, which="org"):
+        if self.views.get(which + "_frame", (None,))[0] != self.version:
+            sub = self.frame().iloc[self.rows(which)]
+            self.views[which + "_frame"] = self.version, sub
+        return self.views[which + "_frame"][1]
+
+
+if __name__.startswith("bokeh_app"):
+    # the shared base outlives the session that built it, so what it holds is
+    # made from the plain module, whose globals `panel serve` never clears
+    globals().update({name: persistent(name) for name in SHARED_CLASSES})
+
+
 class MusicSpace:
     def __init__(self) -> None:
         # build app
@@ -48,21 +1411,28 @@ class MusicSpace:
         )
         # https://github.com/holoviz/panel/issues/5488
         self.notif = pn.state.notifications
-        wgt_pw = pn.widgets.PasswordInput(
+        self.wgt_pw = pn.widgets.PasswordInput(
             name="Password", placeholder="Press <Enter> to confirm"
         )
-        wgt_pw.param.watch(self.cb_pw, "value")
+        self.wgt_pw.param.watch(self.cb_pw, "value")
+        self.wgt_progress = pn.indicators.Progress(
+            value=0, max=5, visible=False, sizing_mode="stretch_width"
+        )
+        self.wgt_status = pn.pane.Markdown()
         modal_btn = pn.widgets.Button(
             name="Enter Password",
             align="center",
         )
         modal_btn.on_click(self.cb_modal)
         self.plot_proj = pn.pane.Plotly()
+        self.plot_proj.param.watch(self.cb_hover, "hover_data")
         self.plot_feat = pn.pane.Plotly()
         self.layout_main = pn.Column(modal_btn, sizing_mode="stretch_width")
         self.layout_modal = pn.Column(
             pn.pane.Markdown("Hint: c#1", styles={"font-size": "120%"}),
-            wgt_pw,
+            self.wgt_pw,
+            self.wgt_progress,
+            self.wgt_status,
             sizing_mode="stretch_both",
         )
         self.template.main.append(self.layout_main)
@@ -70,30 +1440,97 @@ class MusicSpace:
         # init data
         self.exc_single_mem = True
         self.fit_org_only = False
+        self.incremental = True
+        # keep normalization stats as original rows are added instead of
+        # rescaling every row (rows already scaled keep their z-scores)
+        self.stream_z = False
+        self.zstats = None
+        self.precomputed = False
+        self.data_path = DATA_PATH
+        self.data_chunks = None
+        self.neighbor_backend = NEIGHBOR_BACKEND
+        self.lite = LITE
+        # plotly express only draws the raw boxes, lite always summarizes
+        self.box_summary_min = 0 if self.lite else BOX_SUMMARY_MIN
+        self.fit_request = 0
+        self.fit_task = None
+        self.n_fit = 0
+        self.data_version = 0
+        self.graph = None
+        self.embeds = OrderedDict()
+        self.id_rows = dict()
+        self.id_version = None
+        self.hover_trace = None
+        self.sim_index = None
+        self.wgt_similar = None
         self.use_z = True
         self.auth_success = False
-        self.data = None
+        self.tracks = None
         self.model = None
         self.nneighbor = 5
         self.ranges = dict()
         self.cmap = dict()
         self.cid = None
+        self.fetch_workers = FETCH_WORKERS
+        self.cache = None
+        self.track_session()
+
+    @property
+    def data(self):
+        # pandas view of the track store for reading; writes go through
+        # self.tracks
+        return None if self.tracks is None else self.tracks.frame()
+
+    @data.setter
+    def data(self, df):
+        self.tracks = TrackStore.from_frame(
+            df, FEATS + [f + "-z" for f in FEATS] + COMPS
+        )
 
     def serve(self) -> pn.Column:
         return self.template.servable()
 
+    def track_session(self):
+        # only served sessions get a destroyed callback to count down with
+        doc = pn.state.curdoc
+        if doc is None or doc.session_context is None:
+            return
+        registry = metrics()
+        registry.add("music_space_sessions_total")
+        registry.add("music_space_active_sessions", 1, "gauge")
+        pn.state.on_session_destroyed(
+            lambda ctx: registry.add("music_space_active_sessions", -1, "gauge")
+        )
+
+    def memory_bytes(self):
+        # track columns this session wrote to plus its embeddings; columns
+        # still shared with the base belong to no session
+        size = 0 if self.tracks is None else self.tracks.nbytes()
+        return size + sum(comps.nbytes for comps in self.embeds.values())
+
+    def set_progress(self, stage, msg=""):
+        self.wgt_progress.value = stage
+        self.wgt_progress.visible = stage > 0
+        self.wgt_status.object = msg
+
+    @stage("decrypt")
     def decrypt_data(self, pw) -> None:
+        header, tokens = open_container(self.data_path)
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=KEY_SALT,
+            salt=header["salt"],
             iterations=480000,
         )
         key = base64.urlsafe_b64encode(kdf.derive(pw.encode("utf-8")))
         fernet = Fernet(key)
-        self.app_id = fernet.decrypt(APP_ID).decode("utf-8")
-        self.app_secret = fernet.decrypt(APP_SECRET).decode("utf-8")
-        self.data_raw = fernet.decrypt(DATA).decode("utf-8")
+        self.app_id = fernet.decrypt(header["app_id"]).decode("utf-8")
+        self.app_secret = fernet.decrypt(header["app_secret"]).decode("utf-8")
+        if tokens is None:
+            self.data_chunks = iter([fernet.decrypt(DATA)])
+        else:
+            # decrypted lazily by load_data
+            self.data_chunks = decrypt_chunks(fernet, tokens, header["chunks"])
 
     def setup_spotify(self) -> None:
         auth = SpotifyClientCredentials(
@@ -101,37 +1538,197 @@ class MusicSpace:
         )
         self.feats = FEATS
         self.feats_z = [f + "-z" for f in self.feats]
-        self.sp = spotipy.Spotify(client_credentials_manager=auth)
-        self.data = pd.read_csv(StringIO(self.data_raw))
+        self.sp = spotipy.Spotify(
+            client_credentials_manager=auth,
+            requests_session=build_session(self.fetch_workers),
+        )
+        self.cache = TrackCache.open()
+
+    @stage("load")
+    def load_data(self) -> None:
+        # each chunk is parsed into arrays and its plaintext dropped before
+        # the next one is decrypted
+        chunks, self.data_chunks = self.data_chunks, None
+        frames, embeds = [], []
+        for raw in chunks:
+            if raw.startswith(PAYLOAD_MAGIC):
+                payload = read_payload(raw)
+                if self.payload_matches(payload[3]):
+                    embeds.append(self.load_payload(payload, bool(embeds)))
+                else:
+                    # embedded under other settings: only its tracks are
+                    # used, enriched and fit at login like csv data
+                    frames.append(payload[0][["lab", "member", "uri"]])
+            else:
+                frames.append(pd.read_csv(BytesIO(raw)))
+            del raw
+        if embeds:
+            return self.load_embeds(embeds)
+        self.data = pd.concat(frames, ignore_index=True)
         if self.exc_single_mem:
             mem_count = self.data.groupby("lab")["member"].nunique()
             keep_labs = mem_count.index[mem_count > 1]
             self.data = self.data[self.data["lab"].isin(keep_labs)].copy()
 
+    def payload_matches(self, meta):
+        offline = meta.get("exc_single_mem", True)
+        if offline and not self.exc_single_mem:
+            raise ValueError("Payload only holds labs with several members")
+        return offline == self.exc_single_mem
+
+    def load_payload(self, payload, append=False):
+        # a chunk enriched, filtered and embedded offline by
+        # generate_encrypted.py: no spotify requests and no fit at login
+        data, zstats, embeds, meta = payload
+        data["new"] = False
+        data["annot"] = False
+        if append:
+            self.tracks.extend(data)
+        else:
+            self.data = data
+            self.tracks.reserve(meta.get("rows", len(data)))
+            self.zstats = zstats
+        return meta.get("model", "isomap"), embeds
+
+    def load_embeds(self, chunks) -> None:
+        self.data_version += 1
+        model, first = chunks[0]
+        for k in first:
+            comps = np.concatenate([embeds[k] for _, embeds in chunks])
+            self.embeds[self.embed_key(model, k)] = comps.astype(float)
+        self.precomputed = True
+
+    def export_payload(self, n_neighbors, model="isomap", rows=CHUNK_ROWS):
+        # the offline half of load_payload, run by generate_encrypted.py on a
+        # populated session
+        embeds = dict()
+        for k in n_neighbors:
+            self.nneighbor = k
+            self.update_model(model)
+            embeds[k] = self.data[COMPS].to_numpy()
+        return pack_chunks(
+            self.data,
+            self.feats,
+            self.zstats,
+            embeds,
+            {"model": model, "exc_single_mem": self.exc_single_mem},
+            rows,
+        )
+
+    def base_key(self, pw):
+        # keyed hmac so the shared cache never holds anything password-derived
+        # that is cheaper to attack than the pbkdf2 it short-circuits
+        digest = hmac.new(
+            shared_state()["secret"], pw.encode("utf-8"), "sha256"
+        ).hexdigest()
+        return digest, self.exc_single_mem, self.use_z, self.fit_org_only
+
+    def share_base(self, pw) -> None:
+        base = {
+            "app_id": self.app_id,
+            "app_secret": self.app_secret,
+            "tracks": self.tracks.copy(),
+            "cmap": dict(self.cmap),
+            "model": self.model,
+            "nneighbor": self.nneighbor,
+            "n_fit": self.n_fit,
+            "data_version": self.data_version,
+            "graph": self.graph,
+            "zstats": self.zstats,
+            "embeds": OrderedDict(self.embeds),
+            "sim_index": self.sim_index,
+        }
+        state = shared_state()
+        with state["lock"]:
+            state["bases"].setdefault(self.base_key(pw), base)
+
+    def load_base(self, pw) -> bool:
+        state = shared_state()
+        with state["lock"]:
+            base = state["bases"].get(self.base_key(pw))
+        if base is None:
+            return False
+        self.app_id = base["app_id"]
+        self.app_secret = base["app_secret"]
+        self.setup_spotify()
+        # shared arrays: the ones this session writes are copied on write
+        self.tracks = base["tracks"].copy()
+        self.cmap = dict(base["cmap"])
+        self.model = base["model"]
+        self.nneighbor = base["nneighbor"]
+        self.n_fit = base["n_fit"]
+        self.data_version = base["data_version"]
+        self.graph = base["graph"]
+        self.zstats = base["zstats"].copy()
+        self.embeds = OrderedDict(base["embeds"])
+        self.sim_index = base["sim_index"]
+        return True
+
+    def fetch_tracks(self, uris):
+        return fetch_batched(
+            lambda b: self.sp.tracks(b)["tracks"],
+            uris,
+            TRACKS_BATCH,
+            self.fetch_workers,
+        )
+
+    def fetch_feats(self, uris):
+        return fetch_batched(
+            self.sp.audio_features, uris, FEATS_BATCH, self.fetch_workers
+        )
+
+    @stage("fetch")
+    def get_records(self, uris):
+        # None for ids spotify has no track or no audio features for, those
+        # come back as null entries and are never cached
+        ids = [uri_to_id(u) for u in uris]
+        recs = self.cache.get(ids) if self.cache is not None else dict()
+        miss = [i for i in dict.fromkeys(ids) if i not in recs]
+        if miss:
+            tracks = self.fetch_tracks(miss)
+            feats = self.fetch_feats(miss)
+            fetched = {
+                i: make_record(t, f)
+                for i, t, f in zip(miss, tracks, feats)
+                if t is not None and f is not None
+            }
+            if self.cache is not None:
+                self.cache.put(fetched)
+            recs.update(fetched)
+        return [recs.get(i) for i in ids]
+
+    @stage("fetch")
+    def fetch_playlist(self, link):
+        pid = RE_PLAYLIST.match(link.strip()).group(1)
+        page = self.sp.playlist_items(
+            pid, fields="items(track(uri)),next", additional_types=["track"]
+        )
+        uris = []
+        while page is not None:
+            # local files and removed tracks come back without a track uri
+            uris.extend(
+                it["track"]["uri"]
+                for it in page["items"]
+                if it.get("track") and RE_TRACK.match(it["track"].get("uri") or "")
+            )
+            page = self.sp.next(page) if page.get("next") else None
+        return uris
+
     def populate_feats(self):
-        uris = self.data["uri"]
-        tracks = self.sp.tracks(uris)["tracks"]
-        feats = self.sp.audio_features(uris)
-        ims = []
-        for t in tracks:
-            im = t["album"]["images"]
-            imsize = [i["width"] for i in im]
-            ims.append(im[np.argmax(imsize)]["url"])
-        self.data["name"] = [t["name"] for t in tracks]
-        self.data["id"] = [t["id"] for t in tracks]
-        self.data["artist"] = [t["artists"][0]["name"] for t in tracks]
-        self.data["album"] = [t["album"]["name"] for t in tracks]
-        self.data["image"] = ims
-        for fn in self.feats:
-            self.data[fn] = [f[fn] for f in feats]
-        self.data["new"] = False
-        self.data["annot"] = False
+        recs = self.get_records(self.data["uri"])
+        unknown = [u for u, r in zip(self.data["uri"], recs) if r is None]
+        if unknown:
+            raise ValueError("Unknown Spotify tracks: {}".format(", ".join(unknown)))
+        for col in TRACK_COLS + self.feats:
+            self.tracks.set(col, [r[col] for r in recs])
+        self.tracks.set("new", np.zeros(len(recs), dtype=bool))
+        self.tracks.set("annot", np.zeros(len(recs), dtype=bool))
         self.update_data_z()
         self.update_cmap()
 
     def update_cmap(self):
-        org_data = self.data[~self.data["annot"]]
-        annot_data = self.data[self.data["annot"]]
+        org_data = self.tracks.subset("org")
+        annot_data = self.tracks.subset("annot")
         for mem in org_data["member"].unique():
             self.cmap[mem] = qualitative.Plotly[0]
         for lab, c in zip(org_data["lab"].unique(), itt.cycle(qualitative.Safe)):
@@ -141,49 +1738,147 @@ class MusicSpace:
         ):
             self.cmap[mem] = c
 
-    def add_entry(self, member, uri):
+    def lookup_track(self, uri):
+        # the record of one track, None for an invalid or unknown one
         try:
-            track = self.sp.track(uri)
-        except SpotifyException:
+            return self.get_records([uri])[0]
+        except (ValueError, SpotifyException):
+            return None
+
+    def add_entry(self, member, uri):
+        return self.add_record(member, uri, self.lookup_track(uri))
+
+    def add_record(self, member, uri, rec):
+        if rec is None:
             self.notif.error("Invalid Spotify URI")
             return
-        if not (track["id"] in self.data["id"].to_list()):
-            feats = self.sp.audio_features(uri)[0]
-            feats = {fn: feats[fn] for fn in self.feats}
-            im = track["album"]["images"]
-            imsize = [i["width"] for i in im]
-            dat = {
-                "member": member,
-                "uri": uri,
-                "name": track["name"],
-                "id": track["id"],
-                "artist": track["artists"][0]["name"],
-                "album": track["album"]["name"],
-                "image": im[np.argmax(imsize)]["url"],
-                "new": True,
-                "annot": True,
-            }
-            dat.update(feats)
-            self.data = pd.concat([self.data, pd.DataFrame([dat])], ignore_index=True)
-            self.update_data_z()
-            self.update_cmap()
-            if self.fit_org_only:
-                idx = self.data.index[-1]
-                fit_feat = self.feats_z if self.use_z else self.feats
-                comps = self.model.transform(self.data.loc[[idx], fit_feat]).squeeze()
-                for i, p in enumerate(comps):
-                    self.data.loc[idx, "comp{}".format(i)] = p
-            else:
-                self.update_model()
-            return True
+        return self.add_records([member], [uri], [rec]) > 0
+
+    def add_records(self, members, uris, recs):
+        # append the tracks not in the table yet, then update z-scores, colors
+        # and components once for the whole batch
+        seen, new = set(self.row_index()), []
+        for member, uri, rec in zip(members, uris, recs):
+            if rec["id"] in seen:
+                continue
+            seen.add(rec["id"])
+            dat = {"member": member, "uri": uri, "new": True, "annot": True}
+            dat.update(rec)
+            new.append(dat)
+        if not new:
+            return 0
+        rows = np.arange(len(self.tracks), len(self.tracks) + len(new))
+        self.tracks.append(new)
+        self.update_data_z(rows)
+        self.update_cmap()
+        if self.sim_index is not None and len(self.sim_index) == rows[0]:
+            fit_feat = self.feats_z if self.use_z else self.feats
+            self.sim_index = self.sim_index.add(self.tracks.values(fit_feat, rows))
+        if self.fit_org_only or self.incremental:
+            fit_feat = self.feats_z if self.use_z else self.feats
+            comps = self.embed_new(self.data[fit_feat].iloc[rows])
+            self.tracks.set_values(COMPS, comps, rows)
         else:
-            return False
+            self.update_model()
+        return len(new)
 
-    def update_data_z(self):
-        org_data = self.data[~self.data["annot"]]
-        for fn in self.feats:
-            mean, std = org_data[fn].mean(), org_data[fn].std()
-            self.data[fn + "-z"] = (self.data[fn] - mean) / std
+    def read_import(self, raw):
+        # member,uri pairs from an uploaded csv
+        df = pd.read_csv(StringIO(raw.decode("utf-8-sig")), dtype=str)
+        df.columns = df.columns.str.strip().str.lower()
+        if not {"member", "uri"} <= set(df.columns):
+            raise ValueError("CSV needs member and uri columns")
+        df = df.dropna(subset=["member", "uri"])
+        return df["member"].str.strip().to_list(), df["uri"].str.strip().to_list()
+
+    async def import_entries(self, members, uris):
+        valid = [(m, u) for m, u in zip(members, uris) if RE_TRACK.match(u.strip())]
+        n_invalid = len(uris) - len(valid)
+        if not valid:
+            self.notif.error("No valid Spotify track URIs to import")
+            return 0
+        members, uris = map(list, zip(*valid))
+        try:
+            recs = await run_blocking(self.get_records, uris)
+        except SpotifyException:
+            self.notif.error("Could not fetch tracks from Spotify")
+            return 0
+        # unknown ids are skipped as invalid, the rest is still imported
+        found = [(m, u, r) for m, u, r in zip(members, uris, recs) if r is not None]
+        n_invalid += len(recs) - len(found)
+        if not found:
+            self.notif.error("No valid Spotify track URIs to import")
+            return 0
+        members, uris, recs = map(list, zip(*found))
+        n_new = self.add_records(members, uris, recs)
+        await self.push_new(n_new > 0)
+        self.notif.info(
+            "Imported {} tracks, skipped {} invalid and {} already present".format(
+                n_new, n_invalid, len(uris) - n_new
+            )
+        )
+        return n_new
+
+    def similarity_index(self):
+        # over the features the models are fit on; the buckets of the
+        # approximate neighbor graph are reused when there is one
+        if self.sim_index is None or len(self.sim_index) != len(self.tracks):
+            fit_feat = self.feats_z if self.use_z else self.feats
+            index = getattr(self.graph, "index", None)
+            self.sim_index = SimilarityIndex(
+                self.tracks.values(fit_feat),
+                index.centers_ if isinstance(index, AnnIndex) else None,
+            )
+        return self.sim_index
+
+    def similar(self, tid, k=SIMILAR_K):
+        # the k tracks closest to tid in feature space, the same song picked
+        # by other members included
+        fit_feat = self.feats_z if self.use_z else self.feats
+        row = self.row_index()[tid]
+        dist, rows = self.similarity_index().query(
+            self.tracks.values(fit_feat, [row])[0], k + 1
+        )
+        keep = rows != row
+        sim = self.tracks.take(
+            ["id", "lab", "member", "name", "artist"], rows[keep][:k]
+        )
+        return sim.assign(distance=dist[keep][:k])
+
+    def row_index(self):
+        # id -> row position, rebuilt once per data change instead of
+        # re-indexing the whole frame on every hover
+        if self.id_version != self.data_version:
+            ids = self.data["id"].to_numpy()
+            # first occurrence wins for songs liked by several members
+            self.id_rows = dict(zip(ids[::-1], range(len(ids) - 1, -1, -1)))
+            self.id_version = self.data_version
+        return self.id_rows
+
+    def track_row(self, tid):
+        return self.data.iloc[self.row_index()[tid]]
+
+    @stage("zscore")
+    def update_data_z(self, rows=None):
+        # z-scores against the original rows: stats are computed once, new
+        # rows only scale themselves unless they change the reference
+        self.data_version += 1
+        z_feat = [f + "-z" for f in self.feats]
+        org = self.tracks.rows("org")
+        if rows is not None and self.zstats is not None:
+            rows = np.asarray(rows)
+            new_org = rows[~self.tracks.cols["annot"][rows]]
+            if self.stream_z:
+                self.zstats.update(self.tracks.values(self.feats, new_org))
+            elif len(new_org):
+                rows = None
+        if rows is None:
+            self.zstats = ZStats.from_values(self.tracks.values(self.feats, org))
+            # every row moved, the similarity index is rebuilt on next query
+            self.sim_index = None
+        self.tracks.set_values(
+            z_feat, self.zstats.transform(self.tracks.values(self.feats, rows)), rows
+        )
 
     def init_main(self):
         if self.auth_success:
@@ -197,7 +1892,8 @@ class MusicSpace:
             wgt_info = pn.pane.Alert(
                 "# How to use\n"
                 "- Input the name and favorite song of new lab member to show in music space.\n"
-                "- Hover over individual points to see more info.\n"
+                "- A playlist link adds all of its songs for that member, or upload a CSV with `member` and `uri` columns to add many members at once.\n"
+                "- Hover over individual points to see more info and the songs closest to it in feature space.\n"
                 "- `N_neighbors` is a parameter controlling how divided the points are. "
                 "Lower value will make points more likely to be divided/form local clusters.\n"
                 "- Click [here](https://developer.spotify.com/documentation/web-api/reference/get-audio-features) for explanation of features",
@@ -216,22 +1912,26 @@ class MusicSpace:
                 align="center",
                 sizing_mode="stretch_width",
             )
-            wgt_add = pn.widgets.Button(name="Add Member", align="center")
-            wgt_add.on_click(self.cb_add_member)
-            wgt_nn = pn.widgets.IntSlider(
+            self.wgt_add = pn.widgets.Button(name="Add Member", align="center")
+            self.wgt_add.on_click(self.cb_add_member)
+            self.wgt_import = pn.widgets.FileInput(accept=".csv", align="center")
+            self.wgt_import.param.watch(self.cb_import, "value")
+            self.wgt_nn = pn.widgets.IntSlider(
                 name="N_neighbors",
                 value=5,
                 start=1,
                 end=int(len(self.data) * 0.8),
                 sizing_mode="stretch_width",
             )
-            wgt_nn.param.watch(self.cb_nneighbor, "value")
+            self.wgt_nn.param.watch(self.cb_nneighbor, "value")
             self.wgt_current_tk = pn.pane.Markdown(
                 styles={"font-size": "110%"}, sizing_mode="stretch_width"
             )
             self.wgt_current_im = pn.pane.JPG(sizing_mode="scale_height")
+            self.wgt_similar = pn.pane.Markdown(sizing_mode="stretch_width")
             self.cid = self.data["id"][0]
             self.update_current_tk()
+            # filled in by login once the similarity index is built
             self.layout_main.clear()
             self.layout_main.extend(
                 [
@@ -242,15 +1942,17 @@ class MusicSpace:
                             pn.Row(
                                 self.wgt_member,
                                 self.wgt_link,
-                                wgt_add,
+                                self.wgt_add,
+                                self.wgt_import,
                                 pn.HSpacer(),
-                                wgt_nn,
+                                self.wgt_nn,
                                 sizing_mode="stretch_width",
                             ),
                             self.plot_proj,
                         ),
                         pn.Column(
                             pn.Row(self.wgt_current_im, self.wgt_current_tk),
+                            self.wgt_similar,
                             self.plot_feat,
                         ),
                     ),
@@ -258,80 +1960,320 @@ class MusicSpace:
             )
             self.template.close_modal()
 
-    def update_model(self, model="isomap"):
+    def build_model(self, model="isomap"):
+        from sklearn.decomposition import PCA
+        from sklearn.manifold import Isomap, SpectralEmbedding
+
+        X_fit = self.fit_input().to_numpy(dtype=float)
         if model == "pca":
-            self.model = PCA(n_components=3, whiten=True)
+            return PCA(n_components=3, whiten=True), X_fit
+        graph = self.neighbor_graph()
+        if model == "isomap" and len(X_fit) >= LANDMARK_MIN:
+            return (
+                LandmarkIsomap(n_neighbors=self.nneighbor, n_components=3),
+                graph.bridged(self.nneighbor),
+            )
         elif model == "isomap":
-            self.model = Isomap(
-                n_neighbors=self.nneighbor,
-                n_components=3,
-                neighbors_algorithm="brute",
+            if not graph.is_connected(self.nneighbor):
+                # sklearn can only complete disconnected graphs from features
+                return (
+                    Isomap(
+                        n_neighbors=self.nneighbor,
+                        n_components=3,
+                        neighbors_algorithm=(
+                            "kd_tree" if graph.algorithm == "ann" else graph.algorithm
+                        ),
+                    ),
+                    X_fit,
+                )
+            return (
+                Isomap(
+                    n_neighbors=self.nneighbor, n_components=3, metric="precomputed"
+                ),
+                graph.graph(self.nneighbor),
             )
         elif model == "spectral":
-            self.model = SpectralEmbedding(n_components=3, n_neighbors=self.nneighbor)
+            return (
+                SpectralEmbedding(
+                    n_components=3,
+                    n_neighbors=self.nneighbor,
+                    affinity="precomputed_nearest_neighbors",
+                ),
+                graph.graph(self.nneighbor),
+            )
+
+    def fit_input(self):
         fit_feat = self.feats_z if self.use_z else self.feats
         if self.fit_org_only:
-            self.model.fit(self.data.loc[~self.data["annot"], fit_feat])
-            comps = self.model.transform(self.data[fit_feat])
+            return self.tracks.subset("org")[fit_feat]
+        return self.data[fit_feat]
+
+    def neighbor_graph(self):
+        if (
+            self.graph is None
+            or self.graph.version != self.data_version
+            or self.graph.backend != self.neighbor_backend
+        ):
+            self.graph = NeighborGraph(
+                self.fit_input(),
+                self.data_version,
+                max(GRAPH_K, self.nneighbor),
+                self.neighbor_backend,
+            )
+        return self.graph
+
+    def embed_key(self, model="isomap", k=None):
+        if model == "pca":
+            return model, None, None, self.data_version, len(self.data)
+        return (
+            model,
+            self.nneighbor if k is None else k,
+            self.neighbor_backend,
+            self.data_version,
+            len(self.data),
+        )
+
+    def update_model(self, model="isomap", fitted=None, n_fit=None):
+        key = self.embed_key(model)
+        comps = self.embeds.get(key) if fitted is None else None
+        if comps is not None:
+            # memoized embedding, later rows get placed by neighbor averaging
+            self.embeds.move_to_end(key)
+            self.model, self.n_fit = None, len(self.fit_input())
         else:
-            comps = self.model.fit_transform(self.data[fit_feat])
+            if fitted is None:
+                with stage("fit"):
+                    est, X_in = self.build_model(model)
+                    fitted, n_fit = est.fit(X_in), X_in.shape[0]
+            self.model, self.n_fit = fitted, n_fit
+            comps = self.fitted_comps()
+            self.embeds[key] = comps
+            while len(self.embeds) > EMBED_CACHE:
+                self.embeds.popitem(last=False)
+        prev = self.data[COMPS].to_numpy()
+        if len(prev) == len(comps) and np.isfinite(prev).all():
+            comps = align(comps, prev)
         for i in range(3):
             c = comps[:, i]
-            self.data["comp{}".format(i)] = c
+            self.tracks.set(COMPS[i], c)
             # pad = np.ptp(c) * 0.02
             # self.ranges["comp{}".format(i)] = np.min(c) - pad, np.max(c) + pad
 
-    def init_proj_plot(self, theme=None):
+    def fitted_comps(self):
+        fit_feat = self.feats_z if self.use_z else self.feats
+        X = self.data[fit_feat].to_numpy(dtype=float)
+        if hasattr(self.model, "embedding_"):
+            comps = self.model.embedding_
+        else:
+            comps = self.model.transform(X[: self.n_fit])
+        if len(comps) < len(X):
+            # annotated rows outside the fit, or added while it was running
+            extra = self.embed_new(X[len(comps) :], comps)
+            comps = np.concatenate([comps, extra])
+        return comps
+
+    async def fit_model(self, model="isomap", request=None):
+        if self.embed_key(model) in self.embeds:
+            self.update_model(model)
+            return True
+        if self.lite:
+            await load_fit_packages()
+        with stage("fit"):
+            est, X_in = await run_blocking(self.build_model, model)
+            if isinstance(est, LandmarkIsomap):
+                state = await run_in_process(
+                    AppImport("fit_landmark"),
+                    X_in,
+                    est.n_neighbors,
+                    est.n_components,
+                    est.n_landmarks,
+                )
+                fitted = est
+                fitted.__dict__.update(state)
+            else:
+                fitted = await run_in_process(est.fit, X_in)
+        if request is not None and request != self.fit_request:
+            # a newer request came in while this one was fitting
+            return False
+        self.update_model(model, fitted, X_in.shape[0])
+        return True
+
+    async def schedule_fit(self, debounce=0):
+        # latest request wins: wait out the debounce, cancel an outdated fit
+        # still queued for a worker, and only draw the newest result
+        self.fit_request += 1
+        request = self.fit_request
+        if debounce:
+            await asyncio.sleep(debounce)
+            if request != self.fit_request:
+                return
+        if self.fit_task is not None:
+            self.fit_task.cancel()
+        self.fit_task = asyncio.ensure_future(self.fit_model(request=request))
+        try:
+            if not await self.fit_task:
+                return
+        except asyncio.CancelledError:
+            return
+        self.patch_proj_plot()
+
+    def embed_new(self, X, ref_comps=None):
+        # out-of-sample placement against the last fit, e.g. isomap reuses
+        # its neighbor graph and geodesic distances
+        X = np.asarray(X, dtype=float)
+        X_ref = self.fit_input().to_numpy(dtype=float)[: self.n_fit]
+        if isinstance(self.model, LandmarkIsomap) or (
+            getattr(self.model, "metric", None) == "precomputed"
+        ):
+            from sklearn.metrics import pairwise_distances
+
+            return self.model.transform(pairwise_distances(X, X_ref))
+        if hasattr(self.model, "transform"):
+            return self.model.transform(X)
+        # no transform (spectral, memoized fits), average the nearest fit points
+        if ref_comps is None:
+            ref_comps = self.data[["comp0", "comp1", "comp2"]].to_numpy()
+        ref_comps = ref_comps[: self.n_fit]
+        d = (
+            (X**2).sum(1)[:, None] - 2 * X @ X_ref.T + (X_ref**2).sum(1)[None, :]
+        ).clip(0)
+        k = min(self.nneighbor, self.n_fit)
+        nn = np.argpartition(d, k - 1, axis=1)[:, :k]
+        w = 1 / (np.sqrt(np.take_along_axis(d, nn, axis=1)) + 1e-9)
+        return (w[..., None] * ref_comps[nn]).sum(1) / w.sum(1, keepdims=True)
+
+    def needs_refit(self):
+        drift = len(self.data) - self.n_fit
+        return (
+            self.incremental
+            and not self.fit_org_only
+            and drift > REFIT_FRAC * self.n_fit
+        )
+
+    def proj_groups(self):
+        # row positions drawn by each trace of the projection plot: one trace
+        # per lab, then one for all annotated members
+        org = self.tracks.rows("org")
+        codes = self.tracks.codes["lab"][org]
+        labs = list(self.tracks.cats["lab"])
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(labs))
+        groups = [
+            (labs[c], org[rows])
+            for c, rows in enumerate(np.split(order, np.cumsum(counts)[:-1]))
+            if len(rows)
+        ]
+        groups.append(("id_annot", self.tracks.rows("annot")))
+        return groups
+
+    def proj_arrays(self, rows, annot=False):
+        dat = self.data.iloc[rows]
+        arrs = {
+            "x": dat["comp0"].to_numpy(),
+            "y": dat["comp1"].to_numpy(),
+            "z": dat["comp2"].to_numpy(),
+            "customdata": dat[["id", "member", "artist", "name"]].to_numpy(),
+        }
+        if annot:
+            arrs["text"] = dat["member"].to_numpy()
+            arrs["marker_color"] = [self.cmap.get(m) for m in dat["member"]]
+        return arrs
+
+    @stage("figure")
+    def build_proj_plot(self, theme=None):
         theme = "plotly" if theme == "light" else "plotly_dark"
-        fig = px.scatter_3d(
-            self.data[~self.data["annot"]],
-            x="comp0",
-            y="comp1",
-            z="comp2",
-            # range_x=self.ranges["comp0"],
-            # range_y=self.ranges["comp1"],
-            # range_z=self.ranges["comp2"],
-            color="lab",
-            color_discrete_map=self.cmap,
+        fig = go.Figure()
+        hover = (
+            "member=%{customdata[1]}<br>artist=%{customdata[2]}"
+            "<br>name=%{customdata[3]}<extra>%{fullData.name}</extra>"
+        )
+        for meta, rows in self.proj_groups():
+            if meta == "id_annot":
+                trace = go.Scatter3d(
+                    name="new members",
+                    mode="markers+text",
+                    marker_symbol="diamond",
+                    **self.proj_arrays(rows, annot=True),
+                )
+            else:
+                trace = go.Scatter3d(
+                    name=meta,
+                    mode="markers",
+                    marker_color=self.cmap.get(meta),
+                    **self.proj_arrays(rows),
+                )
+            trace.update(meta=meta, hovertemplate=hover)
+            fig.add_trace(trace)
+        fig.update_layout(
             template=theme,
-            hover_data=["member", "artist", "name"],
-            custom_data=["id"],
+            autosize=True,
+            legend_title_text="lab",
+            scene={
+                "xaxis_title": "comp0",
+                "yaxis_title": "comp1",
+                "zaxis_title": "comp2",
+            },
         )
-        fig.layout.autosize = True
-        self.plot_proj.object = fig
-        self.add_annt_data(self.data[self.data["annot"]])
-        self.plot_proj.param.watch(self.cb_hover, "hover_data")
+        return fig
 
-    def add_annt_data(self, new_dat):
-        for _, row in new_dat.iterrows():
-            self.plot_proj.object.add_trace(
-                px.scatter_3d(
-                    row.to_frame().T,
-                    x="comp0",
-                    y="comp1",
-                    z="comp2",
-                    color="member",
-                    text="member",
-                    symbol="member",
-                    symbol_sequence=["diamond"],
-                    color_discrete_map=self.cmap,
-                    hover_data=["member", "artist", "name"],
-                    custom_data=["id"],
-                ).data[0]
-            )
+    @stage("push")
+    def init_proj_plot(self, theme=None, fig=None):
+        self.plot_proj.object = fig if fig is not None else self.build_proj_plot(theme)
+
+    @stage("push")
+    def patch_proj_plot(self, coords=True):
+        # restyle the existing traces in place so only changed arrays go over
+        # the websocket; a different set of groups needs a new figure
+        fig = self.plot_proj.object
+        groups = self.proj_groups()
+        if fig is None or [tr.meta for tr in fig.data] != [g[0] for g in groups]:
+            return self.init_proj_plot()
+        with fig.batch_update():
+            for trace, (meta, rows) in zip(fig.data, groups):
+                if len(trace.x) != len(rows):
+                    trace.update(self.proj_arrays(rows, annot=meta == "id_annot"))
+                elif coords:
+                    arrs = self.proj_arrays(rows)
+                    trace.update(x=arrs["x"], y=arrs["y"], z=arrs["z"])
 
     def update_proj_plot(self):
         newdat = self.data[self.data["new"]]
         if len(newdat) > 0:
-            if self.fit_org_only:
-                self.add_annt_data(newdat)
-            else:
-                self.init_proj_plot()
+            # new members only grow the annotation trace, unless they were
+            # fitted along with everyone else
+            self.patch_proj_plot(coords=not (self.fit_org_only or self.incremental))
 
-    def init_feat_plot(self, theme=None):
+    @stage("figure")
+    def build_feat_plot(self, theme=None):
         theme = "plotly" if theme == "light" else "plotly_dark"
-        org_data = self.data[~self.data["annot"]]
+        org_data = self.tracks.subset("org")
         fit_feat = self.feats_z if self.use_z else self.feats
+        if len(org_data) > self.box_summary_min:
+            fig = self.build_feat_summary(org_data, fit_feat)
+            feat_x = np.arange(len(fit_feat))
+        else:
+            fig = self.build_feat_box(org_data, fit_feat)
+            feat_x = fit_feat
+        fig.update_layout(template=theme, autosize=True, margin_r=250)
+        # persistent hover line, only its values get patched on hover
+        fig.add_trace(
+            go.Scatter(
+                x=feat_x,
+                y=np.full(len(fit_feat), np.nan),
+                text=fit_feat,
+                mode="lines",
+                line_width=3,
+                visible=False,
+                meta="id_hover",
+                hovertemplate="member=%{customdata[0]}<br>artist=%{customdata[1]}"
+                "<br>name=%{customdata[2]}<br>feat=%{text}<br>value=%{y}<extra></extra>",
+            )
+        )
+        return fig
+
+    def build_feat_box(self, org_data, fit_feat):
+        import plotly.express as px
+
         dat_melt = org_data.melt(
             id_vars=["lab", "member", "artist", "name"],
             value_vars=fit_feat,
@@ -345,68 +2287,112 @@ class MusicSpace:
             color="lab",
             color_discrete_map=self.cmap,
             category_orders={"feat": fit_feat},
-            template=theme,
             hover_data=["member", "artist", "name"],
         )
         fig.update_traces(opacity=0.5)
-        fig.update_layout(autosize=True, margin_r=250)
-        self.plot_feat.object = fig
+        return fig
 
+    def build_feat_summary(self, org_data, fit_feat):
+        # precomputed boxes: the browser gets five numbers per (lab, feature)
+        # and the outliers, placed on a numeric axis so each lab's outliers
+        # line up with its box
+        codes, labs = pd.factorize(org_data["lab"].to_numpy())
+        values = org_data[fit_feat].to_numpy(dtype=float)
+        stats = box_stats(values, codes)
+        rows, cols = np.nonzero(stats["outliers"])
+        hover = org_data[["member", "artist", "name"]].to_numpy()[rows]
+        width = 0.8 / len(labs)
+        fig = go.Figure()
+        for i, lab in enumerate(labs):
+            x = np.arange(len(fit_feat)) + (i - (len(labs) - 1) / 2) * width
+            fig.add_trace(
+                go.Box(
+                    x=x,
+                    name=lab,
+                    legendgroup=lab,
+                    marker_color=self.cmap.get(lab),
+                    opacity=0.5,
+                    width=width * 0.9,
+                    boxpoints=False,
+                    **{k: stats[k][i] for k in BOX_STATS},
+                )
+            )
+            out = codes[rows] == i
+            fig.add_trace(
+                go.Scatter(
+                    x=x[cols[out]],
+                    y=values[rows[out], cols[out]],
+                    name=lab,
+                    legendgroup=lab,
+                    showlegend=False,
+                    mode="markers",
+                    marker_color=self.cmap.get(lab),
+                    opacity=0.5,
+                    customdata=hover[out],
+                    hovertemplate="member=%{customdata[0]}<br>artist=%{customdata[1]}"
+                    "<br>name=%{customdata[2]}<br>value=%{y}<extra>%{fullData.name}"
+                    "</extra>",
+                )
+            )
+        fig.update_layout(
+            boxmode="overlay",
+            legend_title_text="lab",
+            xaxis={
+                "title": "feat",
+                "tickvals": np.arange(len(fit_feat)),
+                "ticktext": fit_feat,
+            },
+            yaxis_title="value",
+        )
+        return fig
+
+    @stage("push")
+    def init_feat_plot(self, theme=None, fig=None):
+        self.plot_feat.object = fig if fig is not None else self.build_feat_plot(theme)
+        self.hover_trace = next(
+            tr for tr in self.plot_feat.object.data if tr.meta == "id_hover"
+        )
+
+    @stage("push")
     def add_feat_line(self, new_dat):
+        # styled like the hover line, which knows the feature positions
         fit_feat = self.feats_z if self.use_z else self.feats
-        df = new_dat.melt(
-            id_vars=["member", "artist", "name"],
-            value_vars=fit_feat,
-            var_name="feat",
-            value_name="value",
-        )
-        fig = px.line(
-            df,
-            x="feat",
-            y="value",
-            color="member",
-            color_discrete_map=self.cmap,
-            category_orders={"feat": fit_feat},
-            hover_data=["member", "artist", "name"],
+        self.plot_feat.object.add_traces(
+            [
+                go.Scatter(
+                    x=self.hover_trace.x,
+                    y=row[fit_feat].to_numpy(dtype=float),
+                    text=fit_feat,
+                    name=row["member"],
+                    mode="lines",
+                    line={"width": 3, "color": self.cmap.get(row["member"])},
+                    customdata=[[row["member"], row["artist"], row["name"]]]
+                    * len(fit_feat),
+                    hovertemplate=self.hover_trace.hovertemplate,
+                )
+                for _, row in new_dat.iterrows()
+            ]
         )
-        fig.update_traces(line={"width": 3})
-        self.plot_feat.object.add_traces(fig.data[0])
 
+    @stage("push")
     def update_hover_feat(self):
+        # one restyle of the persistent hover line, its size independent of
+        # the number of tracks
         fit_feat = self.feats_z if self.use_z else self.feats
-        row = self.data.set_index("id").loc[self.cid]
-        df = row.to_frame().T.melt(
-            id_vars=["member", "artist", "name"],
-            value_vars=fit_feat,
-            var_name="feat",
-            value_name="value",
-        )
-        fig = px.line(
-            df,
-            x="feat",
-            y="value",
-            color="member",
-            color_discrete_map=self.cmap,
-            category_orders={"feat": fit_feat},
-            hover_data=["member", "artist", "name"],
-        )
-        fig.update_traces(line={"width": 3})
-        trace = fig.data[0]
-        trace["meta"] = "id_hover"
-        old_data = self.plot_feat.object.data
-        hover_idxs = []
-        for idx, tr in enumerate(old_data):
-            if tr["meta"] == "id_hover":
-                hover_idxs.append(idx)
-        if hover_idxs:
-            assert len(hover_idxs) == 1
-            new_data = list(old_data)
-            del new_data[hover_idxs[0]]
-            self.plot_feat.object.data = new_data
-        self.plot_feat.object.add_trace(trace)
+        row = self.track_row(self.cid)
+        with self.plot_feat.object.batch_update():
+            self.hover_trace.update(
+                y=row[fit_feat].to_numpy(dtype=float),
+                name=row["member"],
+                line_color=self.cmap.get(row["member"]),
+                customdata=[[row["member"], row["artist"], row["name"]]]
+                * len(fit_feat),
+                visible=True,
+            )
 
+    @stage("push")
     def update_current_tk(self):
-        cur_t = self.data.set_index("id").loc[self.cid]
+        cur_t = self.track_row(self.cid)
         self.wgt_current_tk.object = (
             "## Liked by **{}**\n## **{}**\n### **{}** • **{}**".format(
                 cur_t["member"], cur_t["name"], cur_t["artist"], cur_t["album"]
@@ -414,46 +2400,137 @@ class MusicSpace:
         )
         self.wgt_current_im.object = cur_t["image"]
 
+    @stage("similar")
+    def update_similar(self):
+        sim = self.similar(self.cid)
+        self.wgt_similar.object = "#### Closest songs\n" + "\n".join(
+            "{}. **{}** • {} — liked by **{}**".format(i + 1, name, artist, member)
+            for i, (name, artist, member) in enumerate(
+                zip(sim["name"], sim["artist"], sim["member"])
+            )
+        )
+
     def cb_modal(self, evt):
         self.template.open_modal()
 
-    def cb_pw(self, evt):
+    @instrument("cb_pw")
+    async def cb_pw(self, evt):
+        # every blocking stage runs in the worker pool so the event loop,
+        # and with it every other session, stays responsive during login
         pw = evt.new
-        if pw:
+        if not pw or self.wgt_pw.disabled:
+            return
+        self.wgt_pw.disabled = True
+        try:
+            await self.login(pw)
+        finally:
+            self.wgt_pw.disabled = False
+            self.set_progress(0)
+
+    async def login(self, pw):
+        self.set_progress(1, "Decrypting data...")
+        if self.load_base(pw):
+            self.auth_success = True
+            self.notif.success("Authentication success")
+        else:
             try:
-                self.decrypt_data(pw)
+                await run_blocking(self.decrypt_data, pw)
             except:
                 self.notif.error("Invalid password")
                 return
+            self.set_progress(2, "Connecting to Spotify...")
             try:
                 self.setup_spotify()
+                await run_blocking(self.load_data)
+                self.model = None
                 self.auth_success = True
                 self.notif.success("Authentication success")
             except:
                 self.notif.error("Authentication failed, check your password")
                 return
+            if not self.precomputed:
+                self.set_progress(3, "Fetching audio features...")
+                try:
+                    await run_blocking(self.populate_feats)
+                except:
+                    self.notif.error("Data corrupted, check uri")
+                    return
+            else:
+                self.update_cmap()
+        # show the layout right away and fill in the plots as they finish
+        self.set_progress(4, "Building music space...")
+        self.plot_proj.loading = self.plot_feat.loading = True
+        self.init_main()
+        self.wgt_nn.disabled = self.wgt_add.disabled = self.wgt_import.disabled = True
+        try:
+            self.init_feat_plot(fig=await run_blocking(self.build_feat_plot))
+            self.plot_feat.loading = False
+            # the similarity index is built after the fit, so it can reuse the
+            # buckets of its neighbor graph, and never on the event loop
+            if self.model is None:
+                await self.fit_model()
+                await run_blocking(self.similarity_index)
+                self.share_base(pw)
+            else:
+                await run_blocking(self.similarity_index)
+            self.update_similar()
+            self.init_proj_plot(fig=await run_blocking(self.build_proj_plot))
+        except Exception as err:
+            self.notif.error("Could not build the music space: {}".format(err))
+        finally:
+            # never leave the controls disabled or the plots spinning
+            self.plot_proj.loading = self.plot_feat.loading = False
+            self.wgt_nn.disabled = False
+            self.wgt_add.disabled = self.wgt_import.disabled = False
+
+    @instrument("cb_add_member")
+    async def cb_add_member(self, evt):
+        member, link = self.wgt_member.value_input, self.wgt_link.value_input
+        if RE_PLAYLIST.match(link.strip()):
+            # a playlist adds all of its tracks for this member
             try:
-                self.populate_feats()
-            except:
-                self.notif.error("Data corrupted, check uri")
+                uris = await run_blocking(self.fetch_playlist, link)
+            except SpotifyException:
+                self.notif.error("Invalid Spotify playlist")
                 return
-            self.update_model()
-            self.init_proj_plot()
-            self.init_feat_plot()
-            self.init_main()
+            await self.import_entries([member] * len(uris), uris)
+            return
+        rec = await run_blocking(self.lookup_track, link)
+        await self.push_new(self.add_record(member, link, rec))
+
+    @instrument("cb_import")
+    async def cb_import(self, evt):
+        if not evt.new:
+            return
+        try:
+            members, uris = self.read_import(evt.new)
+        except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as err:
+            self.notif.error("Could not read CSV: {}".format(err))
+            return
+        await self.import_entries(members, uris)
 
-    def cb_add_member(self, evt):
-        hasNew = self.add_entry(self.wgt_member.value_input, self.wgt_link.value_input)
-        if hasNew:
+    async def push_new(self, has_new):
+        # one plot update and at most one refit for however many rows came in
+        if has_new:
+            new_dat = self.data[self.data["new"]]
             self.update_proj_plot()
-            self.add_feat_line(self.data[self.data["new"]])
-        self.data["new"] = False
+            self.add_feat_line(new_dat)
+            if self.wgt_similar is not None:
+                # show the last added song and its neighbors
+                self.cid = new_dat["id"].iloc[-1]
+                self.update_current_tk()
+                self.update_hover_feat()
+                self.update_similar()
+        self.tracks.set("new", False)
+        if self.needs_refit():
+            await self.schedule_fit()
 
-    def cb_nneighbor(self, evt):
+    @instrument("cb_nneighbor")
+    async def cb_nneighbor(self, evt):
         self.nneighbor = evt.new
-        self.update_model()
-        self.init_proj_plot()
+        await self.schedule_fit(FIT_DEBOUNCE)
 
+    @instrument("cb_hover")
     def cb_hover(self, evt):
         try:
             cid = evt.new["points"][0]["customdata"][0]
@@ -463,8 +2540,10 @@ class MusicSpace:
             self.cid = cid
             self.update_current_tk()
             self.update_hover_feat()
+            self.update_similar()
 
 
 # %% serve app
-ms = MusicSpace()
-ms.serve()
+if __name__ == "__main__" or __name__.startswith("bokeh_app"):
+    ms = MusicSpace()
+    ms.serve()
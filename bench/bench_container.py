@@ -0,0 +1,81 @@
+# %% import and definition
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bench_login  # noqa: E402
+from bench_nneighbor import session  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+
+def load(path):
+    # decrypt and parse as login does, peak memory above what was held before
+    ms = app.MusicSpace()
+    ms.data_path = path
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    ms.decrypt_data(bench_login.PW)
+    ms.load_data()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert ms.precomputed
+    return ms, dt, peak
+
+
+def compile_time(token):
+    # panel serve and pyodide compile app.py from source for every session
+    src = "DATA = {!r}\n".format(token)
+    t0 = time.perf_counter()
+    compile(src, "app.py", "exec")
+    return time.perf_counter() - t0
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--rows", type=int, default=app.CHUNK_ROWS)
+    args = parser.parse_args()
+    for n in args.sizes:
+        ms = session(populate(make_dataset(n), app.FEATS))
+        app.KEY_SALT = os.urandom(16)
+        fernet = bench_login.bench_fernet()
+        app.APP_ID = fernet.encrypt(b"bench-id")
+        app.APP_SECRET = fernet.encrypt(b"bench-secret")
+        # one token in the module constant, as generate_encrypted.py used to
+        # print it, against the chunked container file
+        (single,) = ms.export_payload([3, 5, 10], rows=n)
+        app.DATA = fernet.encrypt(single)
+        chunks = ms.export_payload([3, 5, 10], rows=args.rows)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.enc")
+            with open(path, "w") as outf:
+                outf.writelines(
+                    app.pack_container(
+                        fernet, app.KEY_SALT, "bench-id", "bench-secret", chunks
+                    )
+                )
+            for name, p in [("constant", None), ("container", path)]:
+                loaded, dt, peak = load(p)
+                assert len(loaded.data) == len(ms.data)
+                print(
+                    "n={:>6} {:>9} chunks={:>3} load={:6.2f}s peak={:7.1f}MB "
+                    "held={:7.1f}MB compile={:6.3f}s".format(
+                        n,
+                        name,
+                        1 if p is None else len(chunks),
+                        dt,
+                        peak / 2**20,
+                        # the constant stays in memory for the process lifetime
+                        (len(app.DATA) if p is None else 0) / 2**20,
+                        compile_time(app.DATA) if p is None else 0,
+                    )
+                )
@@ -0,0 +1,68 @@
+# %% import and definition
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fake_spotify  # noqa: E402
+from synth import make_dataset  # noqa: E402
+
+import app  # noqa: E402
+
+
+def login_fetch(data, prefix, workers, cache=None):
+    ms = app.MusicSpace()
+    ms.feats = app.FEATS
+    ms.feats_z = [f + "-z" for f in ms.feats]
+    ms.fetch_workers = workers
+    ms.sp = fake_spotify.client(prefix, app.build_session(workers))
+    ms.cache = cache
+    ms.data = data.copy()
+    t0 = time.perf_counter()
+    ms.populate_feats()
+    return time.perf_counter() - t0, ms
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, app.FETCH_WORKERS]
+    )
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rate-limit", type=float, default=0.02)
+    parser.add_argument(
+        "--cache", action="store_true", help="also time cold and warm cached logins"
+    )
+    args = parser.parse_args()
+    with fake_spotify.serve(latency=args.latency, rate_limit=args.rate_limit) as (
+        srv,
+        prefix,
+    ):
+        for n in args.sizes:
+            data = make_dataset(n)
+            for w in args.workers:
+                srv.counts.update(requests=0, throttled=0, ids=0)
+                dt, ms = login_fetch(data, prefix, w)
+                assert (ms.data["id"] == data["uri"].str.split(":").str[-1]).all()
+                print(
+                    "n={:>6} workers={:>2} time={:8.3f}s requests={} throttled={}".format(
+                        n, w, dt, srv.counts["requests"], srv.counts["throttled"]
+                    )
+                )
+            if not args.cache:
+                continue
+            with tempfile.TemporaryDirectory() as tmp:
+                cache = app.TrackCache(path=os.path.join(tmp, "tracks.sqlite"))
+                for run in ["cold", "warm"]:
+                    srv.counts.update(requests=0, throttled=0, ids=0)
+                    dt, ms = login_fetch(data, prefix, app.FETCH_WORKERS, cache)
+                    print(
+                        "n={:>6} cache={} time={:8.3f}s requests={}".format(
+                            n, run, dt, srv.counts["requests"]
+                        )
+                    )
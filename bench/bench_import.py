@@ -0,0 +1,107 @@
+# %% import and definition
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fake_spotify  # noqa: E402
+from bench_incremental import session  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+
+class Notif:
+    def __getattr__(self, name):
+        return lambda msg: None
+
+
+class Input:
+    def __init__(self, value) -> None:
+        self.value_input = value
+
+
+def count_calls(ms, names):
+    counts = dict.fromkeys(names, 0)
+    for name in names:
+        func = getattr(ms, name)
+
+        def wrapped(*args, _func=func, _name=name, **kwargs):
+            counts[_name] += 1
+            return _func(*args, **kwargs)
+
+        setattr(ms, name, wrapped)
+    return counts
+
+
+def new_lab(n_add):
+    uris = ["spotify:track:" + fake_spotify.track_id(10**7 + i) for i in range(n_add)]
+    # a few members with several songs each, plus one repeated song
+    members = ["newlab-member{}".format(i % 8) for i in range(n_add)]
+    return members + members[:1], uris + uris[:1]
+
+
+async def one_by_one(ms, members, uris):
+    for member, uri in zip(members, uris):
+        ms.wgt_member, ms.wgt_link = Input(member), Input(uri)
+        await ms.cb_add_member(None)
+
+
+async def bulk(ms, members, uris):
+    await ms.import_entries(members, uris)
+
+
+async def playlist(ms, pid):
+    ms.wgt_member = Input("playlist-member")
+    ms.wgt_link = Input("spotify:playlist:" + pid)
+    await ms.cb_add_member(None)
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000])
+    parser.add_argument("--add", type=int, default=60)
+    args = parser.parse_args()
+    with fake_spotify.serve() as (srv, prefix):
+        for n in args.sizes:
+            data = populate(make_dataset(n), app.FEATS)
+            members, uris = new_lab(args.add)
+            for name, run in [("one-by-one", one_by_one), ("bulk", bulk)]:
+                ms = session(data, prefix, True)
+                ms.notif = Notif()
+                ms.init_proj_plot()
+                ms.init_feat_plot()
+                counts = count_calls(
+                    ms, ["fit_model", "update_proj_plot", "add_feat_line"]
+                )
+                srv.counts["requests"] = 0
+                t0 = time.perf_counter()
+                asyncio.run(run(ms, members, uris))
+                print(
+                    "n={:>6} {:>10} +{} tracks: {:6.2f}s requests={} fits={} "
+                    "plot updates={} rows={}".format(
+                        n,
+                        name,
+                        args.add,
+                        time.perf_counter() - t0,
+                        srv.counts["requests"],
+                        counts["fit_model"],
+                        counts["update_proj_plot"],
+                        len(ms.data),
+                    )
+                )
+            pid = fake_spotify.playlist_id(n)
+            t0 = time.perf_counter()
+            asyncio.run(playlist(ms, pid))
+            print(
+                "n={:>6}   playlist +{} tracks: {:6.2f}s rows={}".format(
+                    n,
+                    len(fake_spotify.playlist_tracks(pid)),
+                    time.perf_counter() - t0,
+                    len(ms.data),
+                )
+            )
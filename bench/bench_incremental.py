@@ -0,0 +1,79 @@
+# %% import and definition
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import procrustes
+from sklearn.manifold import trustworthiness
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fake_spotify  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+COMPS = ["comp0", "comp1", "comp2"]
+
+
+def session(data, prefix, incremental):
+    ms = app.MusicSpace()
+    ms.feats = app.FEATS
+    ms.feats_z = [f + "-z" for f in ms.feats]
+    ms.sp = fake_spotify.client(prefix)
+    ms.incremental = incremental
+    ms.data = data.copy()
+    ms.update_data_z()
+    ms.update_cmap()
+    ms.update_model()
+    return ms
+
+
+def add_members(ms, n_add):
+    times = []
+    for i in range(n_add):
+        uri = "spotify:track:" + fake_spotify.track_id(10**7 + i)
+        t0 = time.perf_counter()
+        assert ms.add_entry("member{}".format(i), uri)
+        times.append(time.perf_counter() - t0)
+        ms.tracks.set("new", False)
+    return np.array(times) * 1e3
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    parser.add_argument("--add", type=int, default=20)
+    args = parser.parse_args()
+    with fake_spotify.serve() as (srv, prefix):
+        for n in args.sizes:
+            data = populate(make_dataset(n), app.FEATS)
+            res = dict()
+            for incremental in [False, True]:
+                ms = session(data, prefix, incremental)
+                times = add_members(ms, args.add)
+                res[incremental] = ms.data[COMPS].to_numpy()
+                print(
+                    "n={:>6} {:>11} add ms: median={:8.1f} max={:8.1f}".format(
+                        n,
+                        "incremental" if incremental else "refit",
+                        np.median(times),
+                        times.max(),
+                    )
+                )
+            # quality of incremental placement against a full refit
+            X = ms.data[ms.feats_z].to_numpy()
+            _, _, disparity = procrustes(res[False], res[True])
+            k = ms.nneighbor
+            print(
+                "n={:>6} procrustes disparity={:.4f} trustworthiness "
+                "refit={:.4f} incremental={:.4f}".format(
+                    n,
+                    disparity,
+                    trustworthiness(X, res[False], n_neighbors=k),
+                    trustworthiness(X, res[True], n_neighbors=k),
+                )
+            )
@@ -0,0 +1,122 @@
+# %% import and definition
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fake_spotify  # noqa: E402
+from synth import make_dataset  # noqa: E402
+
+import app  # noqa: E402
+
+PW = "benchmark"
+TICK = 0.01
+
+
+class Notif:
+    def success(self, msg):
+        pass
+
+    def error(self, msg):
+        raise RuntimeError(msg)
+
+
+def bench_fernet():
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(), length=32, salt=app.KEY_SALT, iterations=480000
+    )
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(PW.encode("utf-8"))))
+
+
+def encrypt_dataset(data):
+    # mirrors secret/generate_encrypted.py with a known password
+    app.KEY_SALT = os.urandom(16)
+    # the module constants, not a container file next to app.py
+    app.DATA_PATH = None
+    fernet = bench_fernet()
+    app.APP_ID = fernet.encrypt(b"bench-id")
+    app.APP_SECRET = fernet.encrypt(b"bench-secret")
+    app.DATA = fernet.encrypt(data.to_csv(index=False).encode("utf-8"))
+
+
+def patch_spotify(prefix):
+    setup = app.MusicSpace.setup_spotify
+
+    def setup_fake(self):
+        setup(self)
+        self.sp = fake_spotify.client(prefix, app.build_session(self.fetch_workers))
+        self.cache = None
+
+    app.MusicSpace.setup_spotify = setup_fake
+
+
+async def inline(func, *args):
+    return func(*args)
+
+
+async def ticker(lags, done):
+    # stands in for callbacks of other sessions on the same event loop
+    while not done.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - t0 - TICK)
+
+
+async def login(blocking):
+    app.shared_state()["bases"].clear()
+    app.run_blocking = inline if blocking else run_blocking
+    app.run_in_process = inline if blocking else run_in_process
+    ms = app.MusicSpace()
+    ms.notif = Notif()
+    lags, done = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, done))
+    await asyncio.sleep(TICK * 5)
+    lags.clear()
+    t0 = time.perf_counter()
+    await ms.cb_pw(SimpleNamespace(new=PW))
+    dt = time.perf_counter() - t0
+    done.set()
+    await tick
+    assert ms.plot_proj.object is not None
+    return dt, np.array(lags) * 1e3
+
+
+run_blocking = app.run_blocking
+run_in_process = app.run_in_process
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    with fake_spotify.serve(latency=args.latency) as (srv, prefix):
+        patch_spotify(prefix)
+        # spin up the worker processes outside the measurement
+        encrypt_dataset(make_dataset(200))
+        asyncio.run(login(False))
+        for n in args.sizes:
+            encrypt_dataset(make_dataset(n))
+            for blocking in [True, False]:
+                dt, lags = asyncio.run(login(blocking))
+                print(
+                    "n={:>6} {:>8} login={:7.3f}s loop lag ms: "
+                    "p50={:7.1f} p99={:7.1f} max={:7.1f}".format(
+                        n,
+                        "blocking" if blocking else "pipeline",
+                        dt,
+                        np.percentile(lags, 50),
+                        np.percentile(lags, 99),
+                        lags.max(),
+                    )
+                )
@@ -0,0 +1,59 @@
+# %% import and definition
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_nneighbor import session  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+BACKENDS = ["brute", "kd_tree", "ball_tree", "ann"]
+
+
+def measure(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    res = func()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res, elapsed, peak / 2**20
+
+
+def recall(ind, ref):
+    hits = [len(np.intersect1d(a, b)) for a, b in zip(ind, ref)]
+    return np.sum(hits) / ref.size
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backends", nargs="+", default=BACKENDS)
+    parser.add_argument("--models", nargs="+", default=["isomap", "spectral"])
+    args = parser.parse_args()
+    for n in args.sizes:
+        ms = session(populate(make_dataset(n), app.FEATS))
+        ref = None
+        for backend in args.backends:
+            ms.neighbor_backend = backend
+            ms.graph = None
+            _, t_graph, m_graph = measure(ms.neighbor_graph)
+            ind = ms.graph.ind[:, 1 : app.GRAPH_K + 1]
+            if ref is None:
+                ref = ind
+            line = "n={:>6} {:>9} graph: {:7.2f}s {:7.1f}MiB recall={:.3f}".format(
+                n, backend, t_graph, m_graph, recall(ind, ref)
+            )
+            for model in args.models:
+                ms.embeds.clear()
+                _, t_fit, m_fit = measure(lambda: ms.update_model(model))
+                line += " | {}: {:7.2f}s {:7.1f}MiB".format(model, t_fit, m_fit)
+            print(line, flush=True)
@@ -0,0 +1,72 @@
+# %% import and definition
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.manifold import Isomap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+COMPS = ["comp0", "comp1", "comp2"]
+
+
+def session(data):
+    ms = app.MusicSpace()
+    ms.feats = app.FEATS
+    ms.feats_z = [f + "-z" for f in ms.feats]
+    ms.data = data.copy()
+    ms.update_data_z()
+    ms.update_model()
+    return ms
+
+
+def scrub_brute(ms, ks):
+    # what every slider tick used to cost
+    X = ms.fit_input()
+    times = []
+    for k in ks:
+        t0 = time.perf_counter()
+        Isomap(n_neighbors=k, n_components=3, neighbors_algorithm="brute").fit(X)
+        times.append(time.perf_counter() - t0)
+    return np.array(times) * 1e3
+
+
+def scrub(ms, ks):
+    times, moves = [], []
+    for k in ks:
+        prev = ms.data[COMPS].to_numpy()
+        t0 = time.perf_counter()
+        ms.nneighbor = k
+        ms.update_model()
+        times.append(time.perf_counter() - t0)
+        moves.append(np.linalg.norm(ms.data[COMPS].to_numpy() - prev, axis=1).mean())
+    return np.array(times) * 1e3, np.array(moves)
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000])
+    parser.add_argument("--ks", type=int, nargs="+", default=list(range(5, 41, 5)))
+    args = parser.parse_args()
+    for n in args.sizes:
+        ms = session(populate(make_dataset(n), app.FEATS))
+        res = {"brute": (scrub_brute(ms, args.ks), None)}
+        res["graph"] = scrub(ms, args.ks)
+        res["memo"] = scrub(ms, args.ks[::-1])
+        for name, (times, moves) in res.items():
+            print(
+                "n={:>6} {:>5} tick ms: median={:8.1f} max={:8.1f}{}".format(
+                    n,
+                    name,
+                    np.median(times),
+                    times.max(),
+                    "" if moves is None else " mean move={:.3f}".format(moves.mean()),
+                )
+            )
@@ -0,0 +1,57 @@
+# %% import and definition
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_nneighbor import session  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+
+class Event:
+    def __init__(self, new) -> None:
+        self.new = new
+
+
+async def drag(ms, ks, interval):
+    # fire slider events like a drag, then wait for the plot to settle
+    draws, lags = [], []
+    patch = ms.patch_proj_plot
+    ms.patch_proj_plot = lambda *args, **kwargs: draws.append(ms.nneighbor)
+    loop = asyncio.get_running_loop()
+    tasks = []
+    t0 = time.perf_counter()
+    for k in ks:
+        t = loop.time()
+        tasks.append(asyncio.ensure_future(ms.cb_nneighbor(Event(k))))
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - t - interval)
+    await asyncio.gather(*tasks)
+    ms.patch_proj_plot = patch
+    return time.perf_counter() - t0, draws, np.array(lags) * 1e3
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000])
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--ks", type=int, nargs="+", default=list(range(5, 41, 3)))
+    args = parser.parse_args()
+    for n in args.sizes:
+        ms = session(populate(make_dataset(n), app.FEATS))
+        ms.embeds.clear()
+        elapsed, draws, lags = asyncio.run(drag(ms, args.ks, args.interval))
+        print(
+            "n={:>6} {} ticks: settled in {:.2f}s, {} redraw(s) k={}, "
+            "loop lag ms max={:.1f}".format(
+                n, len(args.ks), elapsed, len(draws), draws, lags.max()
+            )
+        )
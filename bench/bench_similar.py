@@ -0,0 +1,72 @@
+# %% import and definition
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fake_spotify  # noqa: E402
+from bench_incremental import session  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+
+def exact(X, x, k):
+    return np.argsort(((X - x) ** 2).sum(axis=1))[:k]
+
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    out = func(*args)
+    return out, time.perf_counter() - t0
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=app.SIMILAR_K)
+    parser.add_argument("--add", type=int, default=20)
+    args = parser.parse_args()
+    with fake_spotify.serve(latency=0) as (srv, prefix):
+        for n in args.sizes:
+            ms = session(populate(make_dataset(n), app.FEATS), prefix, True)
+            X = ms.tracks.values(ms.feats_z)
+            # with the buckets of the model's neighbor graph, and on its own
+            index, t_shared = timed(ms.similarity_index)
+            _, t_own = timed(app.SimilarityIndex, X)
+            rng = np.random.default_rng(0)
+            times, recall = [], []
+            for q in rng.choice(n, min(args.queries, n), replace=False):
+                (_, rows), dt = timed(index.query, X[q], args.k + 1)
+                times.append(dt)
+                recall.append(len(np.intersect1d(rows, exact(X, X[q], args.k + 1))))
+            ids = ms.data["id"].to_numpy()
+            api = [timed(ms.similar, ids[q])[1] for q in rng.choice(n, 50)]
+            t0 = time.perf_counter()
+            for i in range(args.add):
+                uri = "spotify:track:" + fake_spotify.track_id(10**7 + i)
+                ms.add_entry("member{}".format(i), uri)
+            t_add = (time.perf_counter() - t0) / args.add
+            assert len(ms.sim_index) == len(ms.data)
+            times = np.array(times) * 1e3
+            print(
+                "n={:>7} {:>4} build={:6.3f}s (own {:6.3f}s) query ms: "
+                "p50={:6.3f} p99={:6.3f} recall={:5.3f} similar()={:6.3f}ms "
+                "add_entry={:6.1f}ms".format(
+                    n,
+                    "scan" if index.centers is None else "ivf",
+                    t_shared,
+                    t_own,
+                    np.percentile(times, 50),
+                    np.percentile(times, 99),
+                    np.sum(recall) / (len(recall) * (args.k + 1)),
+                    np.median(api) * 1e3,
+                    t_add * 1e3,
+                )
+            )
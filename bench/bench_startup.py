@@ -0,0 +1,214 @@
+# %% import and definition
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+# what the old module imported up front
+EAGER = [
+    "plotly.express",
+    "scipy.linalg",
+    "scipy.sparse.csgraph",
+    "scipy.spatial",
+    "sklearn.decomposition",
+    "sklearn.manifold",
+    "sklearn.metrics",
+    "sklearn.neighbors",
+]
+HEAVY = ["sklearn", "scipy", "plotly.express"]
+
+
+def child(tokens, prefix, eager, data):
+    # a fresh interpreter standing in for the browser tab: import, then log in
+    # with everything inline as pyodide would run it
+    t0 = time.perf_counter()
+    if eager:
+        for mod in EAGER:
+            __import__(mod)
+    sys.path.insert(0, ROOT)
+    import app
+
+    t_import = time.perf_counter() - t0
+    import asyncio
+    from types import SimpleNamespace
+
+    sys.path.insert(0, HERE)
+    import bench_login
+
+    with open(tokens) as tokf:
+        tok = json.load(tokf)
+    app.KEY_SALT = bytes.fromhex(tok["salt"])
+    app.APP_ID, app.APP_SECRET = tok["id"].encode(), tok["secret"].encode()
+    if data == "csv":
+        app.DATA, app.DATA_PATH = tok["csv"].encode(), None
+    else:
+        app.DATA_PATH = tok["payload"]
+    bench_login.patch_spotify(prefix)
+    app.run_blocking = app.run_in_process = bench_login.inline
+    ms = app.MusicSpace()
+    ms.notif = bench_login.Notif()
+    t1 = time.perf_counter()
+    asyncio.run(ms.cb_pw(SimpleNamespace(new=bench_login.PW)))
+    t_login = time.perf_counter() - t1
+    assert ms.plot_proj.object is not None
+    print(
+        json.dumps(
+            {
+                "import": t_import,
+                "login": t_login,
+                "modules": len(sys.modules),
+                "heavy": [m for m in HEAVY if m in sys.modules],
+            }
+        )
+    )
+
+
+def dist_size(names):
+    # installed size of the requirements and everything they pull in; pyodide
+    # wheels differ in absolute size but not in which packages get fetched
+    from importlib import metadata
+
+    from packaging.requirements import Requirement
+
+    seen, todo, size = set(), list(names), 0
+    while todo:
+        name = todo.pop().lower().replace("_", "-")
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            dist = metadata.distribution(name)
+        except metadata.PackageNotFoundError:
+            # stdlib modules pyodide unvendors, e.g. ssl
+            continue
+        size += sum(f.size or 0 for f in dist.files or [])
+        for req in dist.requires or []:
+            req = Requirement(req)
+            if req.marker is None or req.marker.evaluate({"extra": ""}):
+                todo.append(req.name)
+    return size, sorted(seen)
+
+
+def read_requirements(path):
+    with open(path) as reqf:
+        return [l.strip() for l in reqf if l.strip() and not l.startswith("#")]
+
+
+def make_tokens(n, path):
+    # one csv DATA as shipped today and a container file with the precomputed
+    # payload of the same tracks, both encrypted with the benchmark password
+    import asyncio
+    from types import SimpleNamespace
+
+    import bench_login
+    from synth import make_dataset
+
+    import app
+
+    app.shared_state()["bases"].clear()
+    bench_login.encrypt_dataset(make_dataset(n))
+    csv = app.DATA
+    ms = app.MusicSpace()
+    ms.notif = bench_login.Notif()
+    asyncio.run(ms.cb_pw(SimpleNamespace(new=bench_login.PW)))
+    chunks = ms.export_payload([2, 3, 4, 5, 6, 8, 10, 15])
+    container = os.path.join(os.path.dirname(path), "data.enc")
+    with open(container, "w") as outf:
+        outf.writelines(
+            app.pack_container(
+                bench_login.bench_fernet(),
+                app.KEY_SALT,
+                "bench-id",
+                "bench-secret",
+                chunks,
+            )
+        )
+    tok = {
+        "salt": app.KEY_SALT.hex(),
+        "id": app.APP_ID.decode(),
+        "secret": app.APP_SECRET.decode(),
+        "csv": csv.decode(),
+        "payload": container,
+    }
+    with open(path, "w") as tokf:
+        json.dump(tok, tokf)
+    return {"csv": len(csv), "payload": os.path.getsize(container)}
+
+
+# %% run benchmark
+if __name__ == "__main__" and "--child" in sys.argv:
+    _, _, tokens, prefix, eager, data = sys.argv
+    child(tokens, prefix, eager == "eager", data)
+elif __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    import bench_login
+    import fake_spotify
+
+    import app
+
+    results = {"download": dict(), "startup": []}
+    for build, req in [
+        ("current", "requirements.txt"),
+        ("lite", "requirements-lite.txt"),
+    ]:
+        size, dists = dist_size(read_requirements(os.path.join(ROOT, req)))
+        results["download"][build] = {"bytes": size, "packages": dists}
+        print(
+            "{:>8} {}: {:6.1f} MB installed, {} packages".format(
+                build, req, size / 2**20, len(dists)
+            )
+        )
+    builds = [
+        ("current", "eager", "csv", {}),
+        ("lite", "lazy", "payload", {"MUSIC_SPACE_LITE": "1"}),
+    ]
+    with fake_spotify.serve(latency=0) as (srv, prefix):
+        bench_login.patch_spotify(prefix)
+        app.run_blocking = app.run_in_process = bench_login.inline
+        for n in args.sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                tokens = os.path.join(tmp, "tokens.json")
+                nbytes = make_tokens(n, tokens)
+                for build, eager, data, env in builds:
+                    runs = [
+                        json.loads(
+                            subprocess.run(
+                                [sys.executable, __file__, "--child"]
+                                + [tokens, prefix, eager, data],
+                                env=dict(os.environ, **env),
+                                capture_output=True,
+                                text=True,
+                                check=True,
+                            ).stdout.splitlines()[-1]
+                        )
+                        for _ in range(args.repeat)
+                    ]
+                    best = min(runs, key=lambda r: r["import"] + r["login"])
+                    best.update(n=n, build=build, data_bytes=nbytes[data])
+                    results["startup"].append(best)
+                    print(
+                        "n={:>6} {:>8} DATA={:7.1f}kB import={:6.2f}s "
+                        "login={:6.2f}s modules={:>5} heavy={}".format(
+                            n,
+                            build,
+                            nbytes[data] / 1024,
+                            best["import"],
+                            best["login"],
+                            best["modules"],
+                            ",".join(best["heavy"]) or "-",
+                        )
+                    )
+    if args.json:
+        with open(args.json, "w") as outf:
+            json.dump(results, outf, indent=2)
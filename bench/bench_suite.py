@@ -0,0 +1,247 @@
+# %% import and definition
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from bokeh.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bench_login  # noqa: E402
+import fake_spotify  # noqa: E402
+from bench_fetch import login_fetch  # noqa: E402
+from bench_incremental import session  # noqa: E402
+from synth import make_dataset, populate  # noqa: E402
+
+import app  # noqa: E402
+
+PATHS = [
+    "populate_feats",
+    "update_model:pca",
+    "update_model:isomap",
+    "update_model:spectral",
+    "add_entry",
+    "cb_hover",
+    "init_feat_plot",
+    "login",
+]
+
+
+class Notif:
+    def __getattr__(self, name):
+        return lambda msg: None
+
+
+def jsonable(obj):
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+
+def capture(ms, sizes):
+    # bytes the plotly panes send to the browser: property patches as json,
+    # a replaced figure as its full json
+    doc = Document()
+    for pane in [ms.plot_proj, ms.plot_feat]:
+        pane.get_root(doc)
+        apply, update = pane._apply_update, pane._update
+
+        def patched(events, msg, model, ref, _apply=apply):
+            sizes.append(len(json.dumps(msg, default=jsonable)))
+            return _apply(events, msg, model, ref)
+
+        def replaced(ref, model, _update=update, _pane=pane):
+            if _pane.object is not None:
+                sizes.append(len(_pane.object.to_json()))
+            return _update(ref, model)
+
+        pane._apply_update, pane._update = patched, replaced
+
+
+def ready(data, prefix):
+    # a logged in session with both plots and the side panel built
+    ms = session(data, prefix, True)
+    ms.notif = Notif()
+    ms.auth_success = True
+    ms.init_main()
+    ms.init_feat_plot()
+    ms.init_proj_plot()
+    return ms
+
+
+def hover_event(cid):
+    return SimpleNamespace(new={"points": [{"customdata": [cid]}]})
+
+
+def setups(n, data, prefix):
+    # per path: a setup returning the call to measure and the session whose
+    # figure updates count towards the payload. setups run outside the
+    # measurement and leave the shared session ready for the next repeat
+    ms = ready(data, prefix)
+    sizes = []
+    capture(ms, sizes)
+    counter = iter(range(10**6))
+
+    def fetch():
+        fresh = make_dataset(n)
+        return lambda: login_fetch(fresh, prefix, app.FETCH_WORKERS)
+
+    def fit(model):
+        def setup():
+            ms.embeds.clear()
+            ms.graph = None
+
+            def run():
+                ms.update_model(model)
+                ms.patch_proj_plot()
+
+            return run
+
+        return setup
+
+    def add():
+        i = next(counter)
+        uri = "spotify:track:" + fake_spotify.track_id(10**7 + i)
+
+        async def run():
+            await ms.push_new(ms.add_entry("bench-member{}".format(i), uri))
+
+        return lambda: asyncio.run(run())
+
+    def hover():
+        cid = ms.data["id"].iloc[(next(counter) * 7919) % len(ms.data)]
+        return lambda: ms.cb_hover(hover_event(cid))
+
+    def feat_plot():
+        return ms.init_feat_plot
+
+    def login():
+        app.shared_state()["bases"].clear()
+        bench_login.encrypt_dataset(data[["lab", "member", "uri"]])
+        fresh = app.MusicSpace()
+        fresh.notif = bench_login.Notif()
+        capture(fresh, sizes)
+        return lambda: asyncio.run(fresh.cb_pw(SimpleNamespace(new=bench_login.PW)))
+
+    return sizes, {
+        "populate_feats": fetch,
+        "update_model:pca": fit("pca"),
+        "update_model:isomap": fit("isomap"),
+        "update_model:spectral": fit("spectral"),
+        "add_entry": add,
+        "cb_hover": hover,
+        "init_feat_plot": feat_plot,
+        "login": login,
+    }
+
+
+def measure(setup, sizes, repeat):
+    # timed repeats without tracing, then one traced run for peak memory;
+    # payload bytes are taken from the first timed run
+    times, payload = [], None
+    for _ in range(repeat):
+        run = setup()
+        sizes.clear()
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+        if payload is None:
+            payload = sum(sizes)
+    run = setup()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall_s": float(np.median(times)),
+        "wall_all_s": times,
+        "peak_bytes": peak - base,
+        "payload_bytes": payload,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "panel": app.pn.__version__,
+    }
+
+
+def compare(results, baseline):
+    # wall time and payload ratios against an earlier run, by path and size
+    old = {(r["path"], r["n"]): r for r in baseline["results"]}
+    for r in results:
+        b = old.get((r["path"], r["n"]))
+        if b is None:
+            continue
+        print(
+            "{:<22} n={:>7} wall x{:5.2f} peak x{:5.2f} payload x{:5.2f}".format(
+                r["path"],
+                r["n"],
+                r["wall_s"] / max(b["wall_s"], 1e-9),
+                r["peak_bytes"] / max(b["peak_bytes"], 1),
+                r["payload_bytes"] / max(b["payload_bytes"], 1),
+            )
+        )
+
+
+# %% run benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--paths", nargs="+", default=PATHS, choices=PATHS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--out", help="write the results as json to this file")
+    parser.add_argument("--baseline", help="json of an earlier run to compare with")
+    args = parser.parse_args()
+    # everything inline: times are the work itself, not thread handoffs
+    app.run_blocking = app.run_in_process = bench_login.inline
+    results = []
+    with fake_spotify.serve(latency=args.latency) as (srv, prefix):
+        bench_login.patch_spotify(prefix)
+        for n in args.sizes:
+            data = populate(make_dataset(n), app.FEATS)
+            sizes, paths = setups(n, data, prefix)
+            for path in args.paths:
+                res = dict(path=path, n=n, **measure(paths[path], sizes, args.repeat))
+                results.append(res)
+                print(
+                    "{:<22} n={:>7} wall={:8.4f}s peak={:8.1f}MB "
+                    "payload={:9.1f}kB".format(
+                        path,
+                        n,
+                        res["wall_s"],
+                        res["peak_bytes"] / 2**20,
+                        res["payload_bytes"] / 1024,
+                    )
+                )
+    report = {"environment": environment(), "args": vars(args), "results": results}
+    if args.out:
+        with open(args.out, "w") as outf:
+            json.dump(report, outf, indent=2)
+    if args.baseline:
+        with open(args.baseline) as basef:
+            compare(results, json.load(basef))
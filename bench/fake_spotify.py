@@ -0,0 +1,181 @@
+# %% import and definition
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+B62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+LIMITS = {"tracks": 50, "audio-features": 100}
+PLAYLIST_PAGE = 100
+
+
+def track_id(i):
+    rng = random.Random("track{}".format(i))
+    return "".join(rng.choice(B62) for _ in range(22))
+
+
+def playlist_id(i):
+    return track_id("playlist{}".format(i))
+
+
+def playlist_tracks(pid, n=120):
+    return [track_id("{}-{}".format(pid, i)) for i in range(n)]
+
+
+def fake_track(tid):
+    rng = random.Random(tid)
+    return {
+        "id": tid,
+        "uri": "spotify:track:" + tid,
+        "name": "Track {}".format(tid[:6]),
+        "artists": [{"name": "Artist {}".format(rng.randint(0, 999))}],
+        "album": {
+            "name": "Album {}".format(rng.randint(0, 9999)),
+            "images": [
+                {"url": "https://i.scdn.co/image/{}-{}".format(tid, w), "width": w}
+                for w in (64, 300, 640)
+            ],
+        },
+    }
+
+
+def fake_features(tid):
+    rng = random.Random(tid + "feat")
+    return {
+        "id": tid,
+        "uri": "spotify:track:" + tid,
+        "danceability": rng.random(),
+        "energy": rng.random(),
+        "key": rng.randint(0, 11),
+        "loudness": rng.uniform(-30, 0),
+        "mode": rng.randint(0, 1),
+        "speechiness": rng.random() * 0.5,
+        "acousticness": rng.random(),
+        "instrumentalness": rng.random() ** 3,
+        "liveness": rng.random() * 0.6,
+        "valence": rng.random(),
+        "tempo": rng.uniform(60, 200),
+        "duration_ms": rng.randint(90000, 400000),
+        "time_signature": rng.choice([3, 4, 4, 4, 5]),
+    }
+
+
+class FakeSpotify(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, addr, latency=0.0, rate_limit=0.0, retry_after=0, seed=0, unknown=()
+    ):
+        super().__init__(addr, Handler)
+        # ids answered with null entries, as spotify does for unknown tracks
+        self.unknown = set(unknown)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "throttled": 0, "ids": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def throttle(self):
+        with self.lock:
+            return self.rng.random() < self.rate_limit
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        srv = self.server
+        srv.count("requests")
+        if srv.latency:
+            time.sleep(srv.latency)
+        if srv.throttle():
+            srv.count("throttled")
+            return self.reply(
+                429,
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                {"Retry-After": str(srv.retry_after)},
+            )
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts[:2] == ["v1", "playlists"] and parts[3:] in (["tracks"], ["items"]):
+            return self.playlist(parts[2], parse_qs(url.query))
+        if len(parts) < 2 or parts[0] != "v1" or parts[1] not in LIMITS:
+            return self.reply(404, {"error": {"status": 404, "message": "not found"}})
+        endpoint = parts[1]
+        if len(parts) > 2:
+            ids = [parts[2]]
+        else:
+            ids = parse_qs(url.query).get("ids", [""])[0].split(",")
+            ids = [i for i in ids if i]
+        if len(ids) > LIMITS[endpoint]:
+            return self.reply(
+                400, {"error": {"status": 400, "message": "Too many ids requested"}}
+            )
+        srv.count("ids", len(ids))
+        if len(parts) > 2 and ids[0] in srv.unknown:
+            return self.reply(400, {"error": {"status": 400, "message": "invalid id"}})
+        if endpoint == "tracks":
+            objs = [None if i in srv.unknown else fake_track(i) for i in ids]
+            body = objs[0] if len(parts) > 2 else {"tracks": objs}
+        else:
+            feats = [None if i in srv.unknown else fake_features(i) for i in ids]
+            body = {"audio_features": feats}
+        self.reply(200, body)
+
+    def playlist(self, pid, query):
+        tids = playlist_tracks(pid)
+        offset = int(query.get("offset", ["0"])[0])
+        limit = min(int(query.get("limit", [PLAYLIST_PAGE])[0]), PLAYLIST_PAGE)
+        page = tids[offset : offset + limit]
+        nxt = None
+        if offset + limit < len(tids):
+            nxt = "http://{}:{}/v1/playlists/{}/items?offset={}&limit={}".format(
+                *self.server.server_address, pid, offset + limit, limit
+            )
+        self.reply(
+            200,
+            {
+                "items": [{"track": {"uri": "spotify:track:" + t}} for t in page],
+                "next": nxt,
+                "total": len(tids),
+            },
+        )
+
+
+@contextmanager
+def serve(**kwargs):
+    srv = FakeSpotify(("127.0.0.1", 0), **kwargs)
+    th = threading.Thread(target=srv.serve_forever, daemon=True)
+    th.start()
+    try:
+        yield srv, "http://{}:{}/v1/".format(*srv.server_address)
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def client(prefix, session=None):
+    import spotipy
+
+    sp = spotipy.Spotify(auth="fake-token", requests_session=session or True)
+    sp.prefix = prefix
+    return sp
@@ -0,0 +1,38 @@
+# %% import and definition
+import fake_spotify
+import numpy as np
+import pandas as pd
+from fake_spotify import track_id
+
+
+def make_dataset(n_tracks, n_labs=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_labs = n_labs or max(2, int(np.sqrt(n_tracks) / 2))
+    labs = rng.integers(0, n_labs, n_tracks)
+    # roughly 3 songs per member, at least 2 members per lab
+    members = rng.integers(0, max(2, n_tracks // n_labs // 3), n_tracks)
+    return pd.DataFrame(
+        {
+            "lab": ["lab{}".format(l) for l in labs],
+            "member": ["lab{}-member{}".format(l, m) for l, m in zip(labs, members)],
+            "uri": ["spotify:track:" + track_id(i) for i in range(n_tracks)],
+        }
+    )
+
+
+def populate(data, feats):
+    # what populate_feats would fetch from the stand-in server
+    data = data.copy()
+    ids = data["uri"].str.split(":").str[-1]
+    tracks = [fake_spotify.fake_track(i) for i in ids]
+    fts = [fake_spotify.fake_features(i) for i in ids]
+    data["name"] = [t["name"] for t in tracks]
+    data["id"] = ids
+    data["artist"] = [t["artists"][0]["name"] for t in tracks]
+    data["album"] = [t["album"]["name"] for t in tracks]
+    data["image"] = [t["album"]["images"][-1]["url"] for t in tracks]
+    for fn in feats:
+        data[fn] = [f[fn] for f in fts]
+    data["new"] = False
+    data["annot"] = False
+    return data
@@ -1,23 +1,48 @@
 # %% import and definition
 import base64
 import os
+import sys
 
 import yaml
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
 IN_DATA = "./data.csv"
 IN_SEC = "./secret.yml"
 IN_KEY = "./key"
+# read by the app from next to app.py, or from MUSIC_SPACE_DATA
+OUT_DATA = "../data.enc"
+# slider values shipped with precomputed embeddings, others are fitted live
+N_NEIGHBORS = [2, 3, 4, 5, 6, 7, 8, 10, 12, 15, 20, 25, 30, 40]
 
-# %% generating encrypted
+# %% enrich data and precompute embeddings
 with open(IN_KEY, "r") as keyf:
     pw = keyf.readline().encode("utf-8")
 with open(IN_SEC, "r") as secf:
     sec = yaml.safe_load(secf)
-with open(IN_DATA, "r") as datf:
-    dat = "".join(datf.readlines())
+with open(IN_DATA, "rb") as datf:
+    dat = datf.read()
+ms = app.MusicSpace()
+ms.app_id, ms.app_secret = sec["id"], sec["secret"]
+ms.setup_spotify()
+ms.data_chunks = iter([dat])
+ms.load_data()
+ms.populate_feats()
+chunks = ms.export_payload(
+    [k for k in N_NEIGHBORS if k < len(ms.data) * 0.8], model="isomap"
+)
+print(
+    "payload: {} tracks, {} chunks, {} bytes".format(
+        len(ms.data), len(chunks), sum(len(c) for c in chunks)
+    )
+)
+
+# %% generating encrypted
 salt = os.urandom(16)
 kdf = PBKDF2HMAC(
     algorithm=hashes.SHA256(),
@@ -27,7 +52,6 @@ kdf = PBKDF2HMAC(
 )
 key = base64.urlsafe_b64encode(kdf.derive(pw))
 fernet = Fernet(key)
-print("key salt: {}".format(salt))
-print("encrypted app id: {}".format(fernet.encrypt(sec["id"].encode("utf-8"))))
-print("encrypted app secret: {}".format(fernet.encrypt(sec["secret"].encode("utf-8"))))
-print("encrypted data: {}".format(fernet.encrypt(dat.encode("utf-8"))))
+with open(OUT_DATA, "w") as outf:
+    outf.writelines(app.pack_container(fernet, salt, sec["id"], sec["secret"], chunks))
+print("encrypted data: {} ({} bytes)".format(OUT_DATA, os.path.getsize(OUT_DATA)))
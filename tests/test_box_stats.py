@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+import pytest
+
+import app
+
+
+def interp(arr, q):
+    # plotly.js Lib.interp, the "linear" quartile method of raw boxes
+    n = q * len(arr) - 0.5
+    if n < 0:
+        return arr[0]
+    if n > len(arr) - 1:
+        return arr[-1]
+    frac = n % 1
+    return frac * arr[math.ceil(n)] + (1 - frac) * arr[math.floor(n)]
+
+
+def plotly_box(vals):
+    # quartiles and fences as plotly.js box/calc computes them from raw values
+    arr = sorted(vals)
+    q1, med, q3 = interp(arr, 0.25), interp(arr, 0.5), interp(arr, 0.75)
+    iqr = q3 - q1
+    lf = min([q1] + [v for v in arr if v >= q1 - 1.5 * iqr])
+    uf = max([q3] + [v for v in arr if v <= q3 + 1.5 * iqr])
+    return {"q1": q1, "median": med, "q3": q3, "lowerfence": lf, "upperfence": uf}
+
+
+@pytest.mark.parametrize("sizes", [[1, 2, 3, 4], [5, 17, 100], [1000]])
+def test_summary_matches_raw_boxes(sizes):
+    rng = np.random.default_rng(0)
+    codes = np.repeat(np.arange(len(sizes)), sizes)
+    rng.shuffle(codes)
+    values = rng.standard_cauchy((len(codes), 3))
+    stats = app.box_stats(values, codes)
+    for g in range(len(sizes)):
+        for j in range(values.shape[1]):
+            ref = plotly_box(values[codes == g, j])
+            for key in app.BOX_STATS:
+                assert stats[key][g, j] == pytest.approx(ref[key]), (key, g, j)
+
+
+def test_outliers_are_outside_the_fences():
+    rng = np.random.default_rng(1)
+    codes = rng.integers(0, 4, 500)
+    values = rng.standard_cauchy((500, 2))
+    stats = app.box_stats(values, codes)
+    inside = (values >= stats["lowerfence"][codes]) & (
+        values <= stats["upperfence"][codes]
+    )
+    assert (stats["outliers"] == ~inside).all()
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+
+import app
+
+FEATS = ["energy", "tempo"]
+
+
+def make_chunks(n=25, rows=10):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(
+        {
+            "lab": ["lab{}".format(i % 3) for i in range(n)],
+            "member": ["m{}".format(i % 5) for i in range(n)],
+            "uri": ["spotify:track:{}".format(i) for i in range(n)],
+            "id": [str(i) for i in range(n)],
+            "name": ["song ü{}".format(i) for i in range(n)],
+        }
+    )
+    data[FEATS] = rng.normal(size=(n, 2))
+    zstats = app.ZStats.from_values(data[FEATS].to_numpy())
+    data[[f + "-z" for f in FEATS]] = zstats.transform(data[FEATS].to_numpy())
+    embeds = {3: rng.normal(size=(n, 3)), 5: rng.normal(size=(n, 3))}
+    meta = {"model": "isomap", "exc_single_mem": True}
+    return data, embeds, app.pack_chunks(data, FEATS, zstats, embeds, meta, rows)
+
+
+def write(tmp_path, fernet, chunks):
+    path = tmp_path / "data.enc"
+    path.write_text(
+        "".join(app.pack_container(fernet, b"s" * 16, "id", "secret", chunks))
+    )
+    return path
+
+
+def test_round_trip(tmp_path):
+    data, embeds, chunks = make_chunks()
+    assert len(chunks) == 3
+    fernet = Fernet(Fernet.generate_key())
+    header, tokens = app.open_container(write(tmp_path, fernet, chunks))
+    assert header["salt"] == b"s" * 16
+    assert fernet.decrypt(header["app_secret"]) == b"secret"
+    parts = [app.read_payload(raw) for raw in app.decrypt_chunks(fernet, tokens, 3)]
+    out = pd.concat([p[0] for p in parts], ignore_index=True)
+    assert out["name"].tolist() == data["name"].tolist()
+    np.testing.assert_allclose(out[FEATS], data[FEATS], rtol=1e-6)
+    for k, comps in embeds.items():
+        joined = np.concatenate([p[2][k] for p in parts])
+        np.testing.assert_allclose(joined, comps, rtol=1e-6)
+    assert parts[0][3]["rows"] == len(data)
+
+
+@pytest.mark.parametrize("edit", ["truncate", "reorder", "append"])
+def test_tampered_chunks_are_detected(tmp_path, edit):
+    _, _, chunks = make_chunks()
+    fernet = Fernet(Fernet.generate_key())
+    path = write(tmp_path, fernet, chunks)
+    lines = path.read_text().splitlines(keepends=True)
+    if edit == "truncate":
+        lines = lines[:-1]
+    elif edit == "reorder":
+        lines[1], lines[2] = lines[2], lines[1]
+    else:
+        lines.append(lines[-1])
+    path.write_text("".join(lines))
+    _, tokens = app.open_container(path)
+    with pytest.raises(ValueError):
+        list(app.decrypt_chunks(fernet, tokens, len(chunks)))
+
+
+def test_wrong_key_fails(tmp_path):
+    _, _, chunks = make_chunks()
+    path = write(tmp_path, Fernet(Fernet.generate_key()), chunks)
+    _, tokens = app.open_container(path)
+    with pytest.raises(InvalidToken):
+        next(app.decrypt_chunks(Fernet(Fernet.generate_key()), tokens, 3))
+
+
+def test_missing_file_falls_back_to_constants(tmp_path):
+    header, tokens = app.open_container(tmp_path / "missing.enc")
+    assert tokens is None and header["salt"] == app.KEY_SALT
@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import importlib.util
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+import app
+
+sys.path.insert(0, os.path.join(os.path.dirname(app.APP_FILE), "bench"))
+
+import fake_spotify  # noqa: E402
+from synth import make_dataset  # noqa: E402
+
+PW = "shared-base"
+N_TRACKS = 300
+
+
+class Notif:
+    def __getattr__(self, name):
+        return lambda msg: None
+
+    def error(self, msg):
+        raise RuntimeError(msg)
+
+
+async def inline(func, *args):
+    return func(*args)
+
+
+@pytest.fixture
+def spotify():
+    salt = os.urandom(16)
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=480000)
+    fernet = Fernet(base64.urlsafe_b64encode(kdf.derive(PW.encode("utf-8"))))
+    data = make_dataset(N_TRACKS)[["lab", "member", "uri"]]
+    secrets = (
+        salt,
+        fernet.encrypt(b"test-id"),
+        fernet.encrypt(b"test-secret"),
+        fernet.encrypt(data.to_csv(index=False).encode("utf-8")),
+    )
+    app.shared_state()["bases"].clear()
+    with fake_spotify.serve(latency=0) as (srv, prefix):
+        yield srv, prefix, secrets
+    app.shared_state()["bases"].clear()
+
+
+def session_module(name, prefix, secrets):
+    # app.py as `panel serve` runs it for one session
+    spec = importlib.util.spec_from_file_location(name, app.APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    module.KEY_SALT, module.APP_ID, module.APP_SECRET, module.DATA = secrets
+    module.DATA_PATH = None
+    module.run_blocking = module.run_in_process = inline
+    setup = module.MusicSpace.setup_spotify
+
+    def setup_fake(self):
+        setup(self)
+        self.sp = fake_spotify.client(prefix, module.build_session(1))
+        self.cache = None
+
+    module.MusicSpace.setup_spotify = setup_fake
+    return module
+
+
+def end_session(module):
+    # what bokeh does to the module once its session is destroyed
+    del sys.modules[module.__name__]
+    module.__dict__.clear()
+
+
+def login(module):
+    ms = module.MusicSpace()
+    ms.notif = Notif()
+    asyncio.run(ms.cb_pw(SimpleNamespace(new=PW)))
+    assert ms.plot_proj.object is not None
+    return ms
+
+
+def test_login_from_base_of_ended_session(spotify):
+    srv, prefix, secrets = spotify
+    first = session_module("bokeh_app_test_first", prefix, secrets)
+    login(first)
+    end_session(first)
+    n_requests = srv.counts["requests"]
+    ms = login(session_module("bokeh_app_test_second", prefix, secrets))
+    # loaded from the base: nothing decrypted or fetched again
+    assert srv.counts["requests"] == n_requests
+    assert len(ms.data) == N_TRACKS
+
+
+def test_base_objects_survive_their_session(spotify):
+    _, prefix, secrets = spotify
+    first = session_module("bokeh_app_test_first", prefix, secrets)
+    login(first)
+    (base,) = app.shared_state()["bases"].values()
+    end_session(first)
+    assert type(base["tracks"]) is app.TrackStore
+    assert type(base["zstats"]) is app.ZStats
+    assert type(base["sim_index"]) is app.SimilarityIndex
+    assert type(base["graph"]) is app.NeighborGraph
+    # z-score statistics a later session copies and streams rows into
+    zstats = base["zstats"].copy()
+    X = base["tracks"].values(app.FEATS)
+    zstats.update(X[:10])
+    assert zstats.n == base["zstats"].n + 10
+    assert zstats.transform(X).shape == X.shape
+
+
+def test_base_session_adds_hovers_and_refits(spotify):
+    _, prefix, secrets = spotify
+    first = session_module("bokeh_app_test_first", prefix, secrets)
+    login(first)
+    end_session(first)
+    ms = login(session_module("bokeh_app_test_second", prefix, secrets))
+    # add: grows the shared similarity index
+    uri = "spotify:track:" + fake_spotify.track_id(10**7)
+    asyncio.run(ms.push_new(ms.add_entry("new member", uri)))
+    assert len(ms.sim_index) == N_TRACKS + 1
+    # hover: queries it for the closest songs
+    cid = ms.data["id"].iloc[7]
+    ms.cb_hover(SimpleNamespace(new={"points": [{"customdata": [cid]}]}))
+    assert ms.cid == cid and "Closest songs" in ms.wgt_similar.object
+    # slider: refits on the shared neighbor graph
+    asyncio.run(ms.cb_nneighbor(SimpleNamespace(new=9)))
+    assert ms.embed_key("isomap", 9) in ms.embeds
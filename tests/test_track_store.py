@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def make_frame(n=5):
+    return pd.DataFrame(
+        {
+            "id": ["t{}".format(i) for i in range(n)],
+            "lab": ["a", "b"] * (n // 2) + ["a"] * (n % 2),
+            "member": ["m{}".format(i % 3) for i in range(n)],
+            "uri": ["spotify:track:t{}".format(i) for i in range(n)],
+            "year": np.arange(2000, 2000 + n),
+            "energy": np.linspace(0, 1, n),
+            "new": np.zeros(n, dtype=bool),
+        }
+    )
+
+
+def test_frame_round_trip():
+    df = make_frame()
+    out = app.TrackStore.from_frame(df).frame()
+    assert list(out.columns) == list(df.columns)
+    for c in ["id", "uri", "new"]:
+        assert out[c].tolist() == df[c].tolist()
+    for c in ["lab", "member"]:
+        assert out[c].astype(object).tolist() == df[c].tolist()
+    np.testing.assert_allclose(out["year"], df["year"])
+    np.testing.assert_allclose(out["energy"], df["energy"], rtol=1e-6)
+
+
+def test_append_fills_missing_columns():
+    # integer columns from the csv must not block records that lack them
+    store = app.TrackStore.from_frame(make_frame())
+    store.append([{"id": "x", "lab": "c", "member": "new", "energy": 0.5}])
+    out = store.frame()
+    assert len(out) == 6
+    assert np.isnan(out["year"].iloc[-1])
+    assert out["uri"].iloc[-1] is None
+    assert not out["new"].iloc[-1]
+    assert out["lab"].iloc[-1] == "c"
+
+
+def test_extend_and_growth():
+    store = app.TrackStore.from_frame(make_frame(3))
+    for _ in range(20):
+        store.extend(make_frame(3))
+    assert len(store) == 63
+    assert store.frame()["id"].tolist() == ["t0", "t1", "t2"] * 21
+
+
+def test_copies_share_until_written():
+    store = app.TrackStore.from_frame(make_frame())
+    copy = store.copy()
+    assert copy.mat is store.mat
+    copy.set("energy", 2.0)
+    copy.append([{"id": "x", "lab": "a", "member": "m0"}])
+    assert copy.mat is not store.mat
+    assert len(store) == 5
+    assert (store.frame()["energy"] <= 1).all()
+    assert (copy.frame()["energy"].iloc[:5] == 2).all()
+
+
+def test_take_matches_frame():
+    store = app.TrackStore.from_frame(make_frame(8))
+    rows = np.array([6, 1, 3])
+    sub = store.take(["id", "lab", "energy"], rows)
+    ref = store.frame().iloc[rows]
+    assert sub["id"].tolist() == ref["id"].tolist()
+    assert sub["lab"].astype(object).tolist() == ref["lab"].astype(object).tolist()
+    np.testing.assert_allclose(sub["energy"], ref["energy"])
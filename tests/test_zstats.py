@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("batches", [[500], [1, 1, 498], [100, 0, 250, 150]])
+def test_merged_batches_match_pandas(batches):
+    rng = np.random.default_rng(0)
+    X = rng.normal(50, 20, (sum(batches), 4))
+    stats = app.ZStats(4)
+    start = 0
+    for b in batches:
+        stats.update(X[start : start + b])
+        start += b
+    df = pd.DataFrame(X)
+    np.testing.assert_allclose(stats.mean, df.mean().to_numpy())
+    np.testing.assert_allclose(stats.std, df.std().to_numpy())
+    np.testing.assert_allclose(
+        stats.transform(X), ((df - df.mean()) / df.std()).to_numpy()
+    )
+
+
+def test_copy_is_independent():
+    stats = app.ZStats.from_values(np.arange(10.0)[:, None])
+    copy = stats.copy()
+    copy.update(np.full((10, 1), 100.0))
+    assert stats.n == 10 and stats.mean[0] == 4.5